@@ -102,6 +102,24 @@ class Axis:
 
         return AxisStatus(self.pm, status, False)
 
+    def get_move_settings(self):
+        self.error = ''
+        try:
+            return self.axis.get_move_settings_calb()
+        except Exception as err:
+            self.error = str(err)
+            return None
+
+    def set_speed(self, speed: float):
+        self.error = ''
+        try:
+            settings = self.axis.get_move_settings_calb()
+            settings.Speed = speed
+            self.axis.set_move_settings_calb(settings)
+        except Exception as err:
+            self.error = str(err)
+            print(self.error)
+
     def move(self, position: float):
         if self.verbose:
             print(f'Moving to {position}')
@@ -113,6 +131,13 @@ class Axis:
             self.error = str(err)
             print(self.error)
 
+    def wait_for_stop(self, refresh_interval_ms: int = 10):
+        self.error = ''
+        try:
+            self.axis.command_wait_for_stop(refresh_interval_ms)
+        except Exception as err:
+            self.error = str(err)
+
     def move_left(self):
         self.error = ''
         try:
@@ -2,7 +2,7 @@ import time
 
 from PySide6.QtCore import QObject, Signal
 
-from .axis import Axis, AxisStatus
+from axis import Axis, AxisStatus
 
 
 class AxisMonitor(QObject):
@@ -14,9 +14,10 @@ class AxisMonitor(QObject):
     REFRESH_IDLE = 1.
     RECONNECT_ERROR_COUNT = 2
 
-    def __init__(self, axis: Axis, parent=None):
+    def __init__(self, axis: Axis, parent=None, state=None):
         super().__init__(parent)
         self.axis = axis
+        self.state = state  # DeviceStateCache of the stage owning the axis, see XiStage.monitor()
         self.status = None
         self.n_status_error = 0
 
@@ -35,8 +36,13 @@ class AxisMonitor(QObject):
         self.finished.emit()
 
     def get_status(self):
-        self.status = self.axis.get_status()
-        if self.status.status is not None:
+        if self.state is not None:
+            # Reuse a read the scan or GUI made since the last tick, a commanded move always forces a new one
+            state = self.state.get(max_age=self.t_sleep)
+            self.status = None if state.error else state.status
+        else:
+            self.status = self.axis.get_status()
+        if self.status is not None and self.status.status is not None:
             self.n_status_error = 0
             self.t_sleep = self.REFRESH_MOVING if self.status.is_moving else self.REFRESH_IDLE
             self.new_position.emit(self.status)
@@ -0,0 +1,200 @@
+# benchmark.py
+# scan throughput benchmark: runs Scan on simulated or real devices and reports where the time goes per point
+#
+#   python benchmark.py --grid 10x10 --format hdf5 --report bench.json
+#   python benchmark.py --x-sn 27500001 --y-sn 27500002 --cam-sn 12001 --report lab.json --compare bench.json
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+from scan import Scanner_Backend
+from settle import SettlePolicy
+
+# Phases reported in this order, anything else recorded by the scan follows
+PHASES = ('point', 'move', 'move_x', 'move_y', 'settle', 'exposure', 'readout',
+          'accumulate', 'save_queue', 'encode', 'write', 'metadata')
+
+
+def git_version():
+    """Commit of the code being benchmarked"""
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def make_backend(args):
+    """Simulated backend unless serial numbers for the real devices are given"""
+    if args.x_sn or args.y_sn or args.cam_sn:
+        backend = Scanner_Backend(sn_cam=args.cam_sn)
+        backend.connect_stage(args.x_sn, 'x')
+        backend.connect_stage(args.y_sn, 'y')
+        return backend, 'hardware'
+    stage_options = {'velocity': args.sim_velocity, 'acceleration': args.sim_acceleration}
+    camera_options = {'width': args.sim_width, 'height': args.sim_height, 'dtype': args.sim_dtype,
+                      'readout_time': args.sim_readout}
+    return Scanner_Backend(simulate=True, sim_stage_options=stage_options,
+                           sim_camera_options=camera_options), 'simulation'
+
+
+def describe_devices(backend):
+    """Short description of the devices for the report"""
+    def describe(device):
+        if device is None:
+            return None
+        info = {'type': type(device).__name__, 'serial_number': getattr(device, 'serial_number', None)}
+        for attribute in ('velocity', 'acceleration', 'width', 'height', 'readout_time'):
+            if hasattr(device, attribute):
+                info[attribute] = getattr(device, attribute)
+        if hasattr(device, 'dtype'):
+            info['dtype'] = str(device.dtype)
+        return info
+    return {'x_stage': describe(backend.x_stage), 'y_stage': describe(backend.y_stage),
+            'camera': describe(backend.camera)}
+
+
+def validate(args):
+    """Reject settings the scan would refuse, before any device is opened"""
+    if args.frames_per_point < 1:
+        raise ValueError("--frames-per-point must be at least 1")
+    if args.format == 'png':
+        if args.frames_per_point > 1:
+            raise ValueError("PNG only holds 8 and 16-bit frames, use --format tiff, blosc, hdf5 or npy "
+                             "with --frames-per-point")
+        if not args.no_save and args.sim_dtype not in ('uint8', 'uint16'):
+            raise ValueError(f"PNG cannot store {args.sim_dtype} frames, use --format tiff, blosc, hdf5 or npy")
+
+
+def check_run(scan):
+    """Raise if the scan stopped early or frames were not all saved, so failures are never reported as runs"""
+    if scan.scan_error:
+        raise RuntimeError(f"Scan failed: {scan.scan_error}")
+    point = scan.timings.summary().get('point')
+    acquired = point['count'] if point else 0
+    if acquired != scan.num_points:
+        raise RuntimeError(f"Scan acquired {acquired} of {scan.num_points} points")
+    if scan.auto_save:
+        saved = scan.compression_report['frames'] if scan.compression_report else 0
+        if saved != scan.num_points:
+            raise RuntimeError(f"Scan saved {saved} of {scan.num_points} frames")
+
+
+def run(args):
+    validate(args)
+    backend, mode = make_backend(args)
+    num_x, num_y = (int(n) for n in args.grid.lower().split('x'))
+    folder = args.out or tempfile.mkdtemp(prefix='scan_benchmark_')
+
+    runs = []
+    try:
+        backend.camera.set_exposure(args.exposure)
+        for repeat in range(args.repeats):
+            scan = backend.scan
+            scan.setup_scan(num_x, num_y, args.step, args.step, True)
+            scan.setup_settle(SettlePolicy(mode=args.settle, settle_time=args.settle_time))
+            scan.setup_accumulation(args.frames_per_point, args.accumulation)
+            if not scan.setup_saving(folder, f"bench{repeat}_", auto_save=not args.no_save, overwrite=True,
+                                     output_format=args.format, compression=args.compression,
+                                     compression_level=args.compression_level):
+                raise ValueError("Invalid saving settings")
+            start = time.perf_counter()
+            scan.start_scan()
+            wall = time.perf_counter() - start
+            check_run(scan)
+            runs.append({'wall_time': wall, 'points': scan.num_points,
+                         'points_per_second': scan.num_points / wall, 'phases': scan.timings.summary(),
+                         'compression': scan.compression_report})
+    finally:
+        backend.close()
+
+    report = {
+        'label': args.label,
+        'created': datetime.datetime.now().isoformat(),
+        'version': git_version(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'mode': mode,
+        'devices': describe_devices(backend),
+        'settings': {'grid': args.grid, 'step': args.step, 'exposure_ms': args.exposure, 'settle': args.settle,
+                     'settle_time': args.settle_time,
+                     'frames_per_point': args.frames_per_point, 'accumulation': args.accumulation, 'format': args.format, 'compression': args.compression,
+                     'compression_level': args.compression_level,
+                     'save': not args.no_save, 'repeats': args.repeats, 'output_folder': folder},
+        'runs': runs,
+    }
+    return report
+
+
+def print_report(report, baseline=None):
+    print(f"\nBenchmark '{report['label']}' ({report['mode']}, {report['version']})")
+    for n, result in enumerate(report['runs']):
+        print(f"run {n}: {result['points']} points in {result['wall_time']:.2f}s "
+              f"({result['points_per_second']:.2f} points/s)")
+        compression = result.get('compression')
+        if compression and compression['ratio']:
+            print(f"       compression ratio {compression['ratio']:.2f}, "
+                  f"encode {compression['encode_time_per_frame'] * 1e3:.2f} ms per frame")
+    phases = report['runs'][-1]['phases']
+    base_phases = baseline['runs'][-1]['phases'] if baseline else {}
+    names = [p for p in PHASES if p in phases] + sorted(set(phases) - set(PHASES))
+    print(f"{'phase':<12}{'n':>6}{'mean ms':>10}{'median ms':>11}{'p95 ms':>10}{'max ms':>10}"
+          + (f"{'vs base':>10}" if baseline else ''))
+    for name in names:
+        stats = phases[name]
+        line = (f"{name:<12}{stats['count']:>6}{stats['mean']*1e3:>10.2f}{stats['median']*1e3:>11.2f}"
+                f"{stats['p95']*1e3:>10.2f}{stats['max']*1e3:>10.2f}")
+        if name in base_phases and base_phases[name]['median'] > 0:
+            line += f"{stats['median'] / base_phases[name]['median']:>9.2f}x"
+        print(line)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark scan throughput with a per-phase breakdown")
+    parser.add_argument('--label', default='benchmark', help="name stored in the report")
+    parser.add_argument('--grid', default='5x5', help="grid size as NXxNY")
+    parser.add_argument('--step', type=float, default=0.05, help="grid step in stage units")
+    parser.add_argument('--exposure', type=float, default=10, help="exposure in ms")
+    parser.add_argument('--settle', default='zero', choices=SettlePolicy.MODES)
+    parser.add_argument('--settle-time', type=float, default=0.0)
+    parser.add_argument('--frames-per-point', type=int, default=1)
+    parser.add_argument('--accumulation', default='sum', choices=['sum', 'mean'])
+    parser.add_argument('--format', default='png', choices=['png', 'tiff', 'blosc', 'hdf5', 'npy'])
+    parser.add_argument('--compression', help="compression within the format, its default if not given")
+    parser.add_argument('--compression-level', type=int)
+    parser.add_argument('--no-save', action='store_true', help="acquire without saving frames")
+    parser.add_argument('--repeats', type=int, default=1)
+    parser.add_argument('--out', help="output folder, a temporary folder by default")
+    parser.add_argument('--report', help="write the JSON report to this file")
+    parser.add_argument('--compare', help="JSON report of a previous run to compare medians against")
+    parser.add_argument('--x-sn', help="serial number of a real X stage")
+    parser.add_argument('--y-sn', help="serial number of a real Y stage")
+    parser.add_argument('--cam-sn', help="serial number of a real camera")
+    parser.add_argument('--sim-velocity', type=float, default=2.0)
+    parser.add_argument('--sim-acceleration', type=float, default=10.0)
+    parser.add_argument('--sim-width', type=int, default=1440)
+    parser.add_argument('--sim-height', type=int, default=1080)
+    parser.add_argument('--sim-dtype', default='uint16')
+    parser.add_argument('--sim-readout', type=float, default=0.03)
+    args = parser.parse_args()
+    try:
+        validate(args)
+    except ValueError as e:
+        parser.error(str(e))
+
+    report = run(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=4)
+        print(f"Report written to {args.report}")
@@ -0,0 +1,204 @@
+# calibration.py
+# dark-frame and flat-field correction applied to frames before they are saved
+import os
+import datetime
+import json
+import numpy as np
+
+from framecodecs import read_frame
+
+
+class FrameCorrection:
+    """Dark subtraction and flat-field gain correction
+
+    corrected = (frame - frames * dark) * gain, with gain = mean(flat - dark) / (flat - dark)
+    so a uniformly lit sensor comes out flat at its original level. `frames`
+    is the number of exposures summed into the frame, so accumulated sums are
+    corrected with the matching dark level.
+
+    Args:
+        dark: mean dark frame, None for no dark subtraction
+        flat: mean flat frame (not dark subtracted), None for no gain correction
+        keep_dtype: write the result back into integer frames (rounded, clipped at 0)
+            instead of returning float32, so 8/16-bit outputs like PNG still work
+        exposure_ms: exposure the calibration frames were taken with
+    """
+    MIN_GAIN_SIGNAL = 1e-3  # flat - dark below this fraction of its mean is treated as a dead pixel
+
+    def __init__(self, dark=None, flat=None, keep_dtype=False, exposure_ms=None):
+        self.dark = None if dark is None else np.asarray(dark, dtype=np.float32)
+        self.flat = None if flat is None else np.asarray(flat, dtype=np.float32)
+        self.keep_dtype = keep_dtype
+        self.exposure_ms = exposure_ms
+        self.dark_count = 0
+        self.flat_count = 0
+        self.gain = None
+        self._scaled_dark = {}
+        self._update_gain()
+
+    @staticmethod
+    def average_frames(camera, count):
+        """Mean of count frames from the camera, summed in a float64 buffer"""
+        total = None
+        for _ in range(count):
+            frame = np.asarray(camera.snap_image())
+            if total is None:
+                total = np.zeros(frame.shape, dtype=np.float64)
+            np.add(total, frame, out=total)
+        return (total / count).astype(np.float32)
+
+    @staticmethod
+    def load_frames(paths):
+        """Mean frame of a .npy frame or (N, H, W) stack, or of a list of saved frame files"""
+        if isinstance(paths, str) and paths.endswith('.npy'):
+            frames = np.load(paths, mmap_mode='r')
+            return frames.astype(np.float32) if frames.ndim == 2 else frames.mean(axis=0, dtype=np.float64).astype(np.float32)
+        if isinstance(paths, str):
+            paths = [paths]
+        total = None
+        for path in paths:
+            frame = read_frame(path)
+            if total is None:
+                total = np.zeros(frame.shape, dtype=np.float64)
+            np.add(total, frame, out=total)
+        return (total / len(paths)).astype(np.float32)
+
+    def load_dark(self, paths, exposure_ms=None):
+        """Use the mean of previously saved dark frames"""
+        self.dark = self.load_frames(paths)
+        self.dark_count = 1 if isinstance(paths, str) else len(paths)
+        self.exposure_ms = exposure_ms
+        self._update_gain()
+
+    def load_flat(self, paths):
+        """Use the mean of previously saved flat frames"""
+        self.flat = self.load_frames(paths)
+        self.flat_count = 1 if isinstance(paths, str) else len(paths)
+        self._update_gain()
+
+    def acquire_dark(self, camera, count=20):
+        """Average count frames taken with the beam blocked"""
+        print(f"Acquiring {count} dark frames")
+        self.dark = self.average_frames(camera, count)
+        self.dark_count = count
+        self.exposure_ms = camera.exposure
+        self._update_gain()
+
+    def acquire_flat(self, camera, count=20):
+        """Average count frames of a uniformly illuminated field"""
+        print(f"Acquiring {count} flat frames")
+        self.flat = self.average_frames(camera, count)
+        self.flat_count = count
+        self._update_gain()
+
+    def _update_gain(self):
+        self._scaled_dark = {}
+        if self.flat is None:
+            self.gain = None
+            return
+        signal = self.flat - self.dark if self.dark is not None else self.flat.copy()
+        level = float(signal.mean())
+        if level <= 0:
+            print("WARNING: flat frame has no signal above the dark level, gain correction disabled")
+            self.gain = None
+            return
+        dead = signal < self.MIN_GAIN_SIGNAL * level
+        signal[dead] = level
+        self.gain = (level / signal).astype(np.float32)
+        self.gain[dead] = 0.0
+
+    @property
+    def enabled(self):
+        return self.dark is not None or self.gain is not None
+
+    def check(self, frame_shape, exposure_ms):
+        """Warn when the calibration does not match the frames it will correct"""
+        for name, reference in (('dark', self.dark), ('flat', self.flat)):
+            if reference is not None and reference.shape != tuple(frame_shape):
+                raise ValueError(f"{name} frame is {reference.shape}, frames are {tuple(frame_shape)}")
+        if self.dark is not None and self.exposure_ms is not None and exposure_ms != self.exposure_ms:
+            print(f"WARNING: dark frames were taken at {self.exposure_ms}ms, scanning at {exposure_ms}ms")
+
+    def apply(self, frame, out=None, frames=1, subtract_dark=True, result=None):
+        """Correct frame, in place for float32 frames when no out buffer is given
+
+        Integer frames are never modified, the camera may still own them.
+
+        Args:
+            frame: numpy frame, or the sum of `frames` exposures
+            out: float32 working buffer, also the result unless keep_dtype converts back
+            frames: number of exposures summed into frame
+            subtract_dark: False when the dark was already taken off, e.g. from each HDR bracket
+            result: buffer of the frame's dtype receiving the keep_dtype result, a new array by default
+
+        Returns:
+            corrected frame
+        """
+        if not isinstance(frame, np.ndarray) or not self.enabled:
+            return frame
+        if frame.dtype == np.float32 and (out is None or out is frame):
+            work = frame
+        else:
+            work = out if out is not None else np.empty(frame.shape, dtype=np.float32)
+            np.copyto(work, frame, casting='unsafe')
+
+        if self.dark is not None and subtract_dark:
+            np.subtract(work, self._dark_for(frames), out=work)
+        if self.gain is not None:
+            np.multiply(work, self.gain, out=work)
+
+        if not self.keep_dtype or not np.issubdtype(frame.dtype, np.integer):
+            return work
+        limit = np.iinfo(frame.dtype).max
+        np.clip(work, 0, limit, out=work)
+        np.rint(work, out=work)
+        if result is None:
+            result = np.empty_like(frame)
+        np.copyto(result, work, casting='unsafe')
+        return result
+
+    def _dark_for(self, frames):
+        if frames == 1:
+            return self.dark
+        if frames not in self._scaled_dark:
+            self._scaled_dark[frames] = self.dark * frames
+        return self._scaled_dark[frames]
+
+    def describe(self):
+        return {
+            'dark': self.dark is not None,
+            'flat': self.flat is not None,
+            'dark_count': self.dark_count,
+            'flat_count': self.flat_count,
+            'exposure_ms': self.exposure_ms,
+            'keep_dtype': self.keep_dtype,
+        }
+
+    def save(self, folder, prefix):
+        """Write the calibration frames beside the scan output, returns the description file"""
+        for name, frame in (('dark', self.dark), ('flat', self.flat)):
+            if frame is not None:
+                np.save(os.path.join(folder, f"{prefix}{name}.npy"), frame)
+        path = os.path.join(folder, f"{prefix}calibration.json")
+        info = self.describe()
+        info['saved'] = datetime.datetime.now().isoformat()
+        try:
+            with open(path, 'w') as f:
+                json.dump(info, f, indent=4)
+        except IOError as e:
+            print(f"Error saving calibration: {e}")
+        return path
+
+    @classmethod
+    def load(cls, folder, prefix):
+        """Read calibration frames written by save()"""
+        with open(os.path.join(folder, f"{prefix}calibration.json"), 'r') as f:
+            info = json.load(f)
+        frames = {}
+        for name in ('dark', 'flat'):
+            path = os.path.join(folder, f"{prefix}{name}.npy")
+            frames[name] = np.load(path) if info.get(name) else None
+        correction = cls(frames['dark'], frames['flat'], info.get('keep_dtype', False), info.get('exposure_ms'))
+        correction.dark_count = info.get('dark_count', 0)
+        correction.flat_count = info.get('flat_count', 0)
+        return correction
@@ -1,5 +1,7 @@
 from pylablib.devices.Thorlabs import ThorlabsTLCamera
 import cv2
+import numpy as np
+import time
 
 class Camera:
     def __init__(self, serial_number=None):
@@ -8,6 +10,17 @@ class Camera:
         self.exposure = 100  # Default exposure in ms
         self.image_count = 0
         
+        # Armed acquisition: the camera stays running between frames
+        self.armed = False
+        self.trigger_mode = "software"  # "software" or "hardware"
+        self.buffer_frames = 16  # Size of the frame ring buffer while armed
+        self.trigger_timeout = 10.0  # Seconds to wait for a hardware trigger
+        self.last_trigger_time = None  # time.monotonic() when the last exposure was started
+        
+        # Region of interest in sensor pixels (end exclusive) and hardware binning
+        self.roi = None  # (hstart, hend, vstart, vend), None for the full sensor
+        self.binning = (1, 1)  # (hbin, vbin)
+        
         if self.serial_number is None:
             print("WARNING: Camera initialized in simulation mode (no serial number provided)")
             # Put the images in an array
@@ -42,15 +55,132 @@ class Camera:
             # Simulation mode
             print(f"Camera exposure set to {exposure_ms}ms (simulation)")
     
+    def set_roi(self, hstart=0, hend=None, vstart=0, vend=None, hbin=1, vbin=1):
+        """Read out only part of the sensor, optionally binned on the camera
+
+        Args:
+            hstart, hend: first and one past the last column, hend None for the sensor width
+            vstart, vend: first and one past the last row, vend None for the sensor height
+            hbin, vbin: horizontal and vertical binning
+
+        Returns:
+            roi: the ROI the camera accepted, see get_roi()
+        """
+        was_armed = self.armed
+        self.disarm()
+        applied = True
+        if self.camera:
+            try:
+                # The camera rounds the ROI to what the sensor supports, read back what was applied
+                hstart, hend, vstart, vend, hbin, vbin = self.camera.set_roi(hstart, hend, vstart, vend, hbin, vbin)
+            except Exception as e:
+                # Keep the ROI the camera still has
+                print(f"Error setting camera ROI: {e}")
+                applied = False
+        if applied:
+            self.roi = (hstart, hend, vstart, vend)
+            self.binning = (hbin, vbin)
+            print(f"Camera ROI set to columns {hstart}-{hend}, rows {vstart}-{vend}, binning {hbin}x{vbin}")
+        if was_armed:
+            self.arm()
+        return self.get_roi()
+
+    def clear_roi(self):
+        """Read out the full sensor without binning"""
+        return self.set_roi()
+
+    def get_roi(self):
+        """Current ROI and binning as a dict, stored with each scan"""
+        hstart, hend, vstart, vend = self.roi or (0, None, 0, None)
+        hbin, vbin = self.binning
+        return {'hstart': hstart, 'hend': hend, 'vstart': vstart, 'vend': vend, 'hbin': hbin, 'vbin': vbin}
+
+    def get_detector_size(self):
+        """Sensor size as (width, height)"""
+        if self.camera:
+            try:
+                return self.camera.get_detector_size()
+            except Exception as e:
+                print(f"Error reading detector size: {e}")
+        dummy_images = getattr(self, 'dummy_images', None)
+        if dummy_images and dummy_images[0] is not None:
+            return dummy_images[0].shape[1], dummy_images[0].shape[0]
+        return None, None
+
+    def get_saturation_level(self):
+        """Highest raw count the sensor can report"""
+        if self.camera:
+            try:
+                return 2 ** self.camera.get_sensor_info().bit_depth - 1
+            except Exception as e:
+                print(f"Error reading sensor bit depth: {e}")
+                return None
+        # Dummy frames are 8-bit
+        return 255
+
+    def arm(self, trigger_mode=None, buffer_frames=None):
+        """Start an acquisition that stays armed and takes one frame per trigger
+
+        Args:
+            trigger_mode: "software" to trigger from snap_image or "hardware" for external triggers
+            buffer_frames: number of frames held in the camera ring buffer
+
+        Returns:
+            armed: True if the camera is armed
+        """
+        if trigger_mode is not None:
+            self.trigger_mode = trigger_mode
+        if buffer_frames is not None:
+            self.buffer_frames = buffer_frames
+        if self.armed:
+            return True
+        
+        if self.camera:
+            try:
+                self.camera.set_trigger_mode("int" if self.trigger_mode == "software" else "ext")
+                self.camera.setup_acquisition(nframes=self.buffer_frames)
+                # One frame per trigger, and don't fire the first software trigger on start
+                self.camera.start_acquisition(frames_per_trigger=1, auto_start=False)
+                print(f"Camera armed with {self.trigger_mode} trigger and {self.buffer_frames} frame buffer")
+            except Exception as e:
+                print(f"Error arming camera: {e}")
+                return False
+        else:
+            print(f"Camera armed with {self.trigger_mode} trigger (simulation)")
+        self.armed = True
+        return True
+    
+    def disarm(self):
+        """Stop an armed acquisition"""
+        if not self.armed:
+            return
+        self.armed = False
+        if self.camera:
+            try:
+                self.camera.stop_acquisition()
+                self.camera.set_trigger_mode("int")
+                print("Camera disarmed")
+            except Exception as e:
+                print(f"Error disarming camera: {e}")
+    
     def snap_image(self):
         """Take an image with current settings and return image data"""
         self.image_count += 1
         
-        if self.camera:
+        if self.camera and self.armed:
+            try:
+                frame = self._read_triggered_frame()
+                print(f"Image {self.image_count} captured with armed hardware camera")
+            except Exception as e:
+                print(f"Error capturing image: {e}")
+                print("Returning simulated image instead")
+                return f"simulated_image_{self.image_count}"
+        elif self.camera:
             try:
                 # Start acquisition and wait for completion
+                self.last_trigger_time = time.monotonic()
                 self.camera.start_acquisition()
-                frame = self.camera.grab(frame_timeout=2 * self.exposure / 1000.0)  # Wait longer than exposure
+                frame = self.camera.grab(frame_timeout=2 * self.exposure / 1000.0)[0]  # Wait longer than exposure
                 self.camera.stop_acquisition()
                 
                 # In a real app, you might want to save this image
@@ -58,18 +188,44 @@ class Camera:
             except Exception as e:
                 print(f"Error capturing image: {e}")
                 # Generate a dummy image in case of error
-                print(f"Returning simulated image instead")
+                print("Returning simulated image instead")
                 return f"simulated_image_{self.image_count}"
         else:
             # Simulation mode
+            self.last_trigger_time = time.monotonic()
             print(f"Image {self.image_count} captured with {self.exposure}ms exposure (simulation)")
             # In simulation mode, we return a string instead of image data
             frame = self.dummy_images[self.image_count%2]
+            if self.roi is not None or self.binning != (1, 1):
+                hstart, hend, vstart, vend = self.roi or (0, None, 0, None)
+                hbin, vbin = self.binning
+                frame = frame[vstart:vend, hstart:hend]
+                # Binned pixels collect the charge of every pixel in the bin, clipped like a full well
+                h, w = frame.shape[0] // vbin * vbin, frame.shape[1] // hbin * hbin
+                binned = frame[:h, :w].reshape(h // vbin, vbin, w // hbin, hbin, *frame.shape[2:]).sum(axis=(1, 3))
+                frame = np.minimum(binned, np.iinfo(frame.dtype).max).astype(frame.dtype)
         return frame
+    
+    def _read_triggered_frame(self):
+        """Trigger (if in software mode) and read the next frame from the ring buffer"""
+        # Drop anything left in the buffer so we only return a frame taken after this call
+        self.camera.read_multiple_images()
+        if self.trigger_mode == "software":
+            self.last_trigger_time = time.monotonic()
+            self.camera.send_software_trigger()
+            timeout = 2 * self.exposure / 1000.0 + 1.0
+        else:
+            timeout = self.trigger_timeout
+        self.camera.wait_for_frame(since="lastread", timeout=timeout)
+        if self.trigger_mode != "software":
+            # The external trigger time is unknown, assume the frame arrived right after the exposure
+            self.last_trigger_time = time.monotonic() - self.exposure / 1000.0
+        return self.camera.read_oldest_image()
         
 
     def close(self):
         """Properly close the connection to the hardware"""
+        self.disarm()
         if self.camera:
             try:
                 print("Closing connection to camera")
@@ -1,13 +1,77 @@
 import tkinter as tk
 from tkinter import messagebox
-import cv2
+import threading
 from PIL import Image, ImageTk
 import time
 from camera import Camera
+from preview import LatestFrame, preview_image
+
+
+class PreviewCanvas:
+    """Canvas showing the latest frame of a LatestFrame channel
+
+    Polls from the Tk loop every interval_ms and only renders when a newer
+    frame has been published, so acquisition never waits on the display and
+    frames arriving faster than the display rate are dropped.
+
+    Args:
+        source: LatestFrame, or a callable returning the LatestFrame to show
+        log_scale: display log(1 + counts)
+    """
+    def __init__(self, master, source, width=640, height=480, interval_ms=200, log_scale=True):
+        self.master = master
+        self.source = source
+        self.width = width
+        self.height = height
+        self.interval_ms = interval_ms
+        self.log_scale = log_scale
+        self.canvas = tk.Canvas(master, width=width, height=height, bg="black")
+        self.info_label = tk.Label(master, text="")
+        self._sequence = 0
+        self._channel = None
+        self._image = None
+        self.master.after(self.interval_ms, self._poll)
+
+    def grid(self, row, column, columnspan=1, **options):
+        self.canvas.grid(row=row, column=column, columnspan=columnspan, **options)
+        self.info_label.grid(row=row + 1, column=column, columnspan=columnspan)
+
+    def pack(self, **options):
+        self.canvas.pack(**options)
+        self.info_label.pack()
+
+    def _poll(self):
+        if not self.canvas.winfo_exists():
+            return
+        channel = self.source() if callable(self.source) else self.source
+        if channel is not self._channel:
+            # The scan object was replaced, start from its first frame
+            self._channel = channel
+            self._sequence = 0
+        latest = channel.latest(self._sequence) if channel is not None else None
+        if latest is not None:
+            self._sequence, frame, info = latest
+            self.show(frame, info)
+        self.master.after(self.interval_ms, self._poll)
+
+    def show(self, frame, info=None):
+        """Display a frame now, from the Tk thread"""
+        image = preview_image(frame, self.width, self.height, self.log_scale)
+        self._image = ImageTk.PhotoImage(image=Image.fromarray(image))
+        self.canvas.delete("all")
+        self.canvas.create_image(0, 0, image=self._image, anchor=tk.NW)
+        info = dict(info or {})
+        # Downsampled frames carry the shape of the full frame
+        shape = "x".join(str(n) for n in info.pop('shape', frame.shape[:2]))
+        details = ", ".join(f"{key}: {value:.4g}" if isinstance(value, float) else f"{key}: {value}"
+                            for key, value in info.items())
+        self.info_label.config(text=f"{shape} {frame.dtype}  {details}")
+
 
 class CameraGUI:
-    def __init__(self, master, camera, reconnects=False):
+    def __init__(self, master, camera, reconnects=False, preview=None):
         self.master = master
+        self._grabbing = False
 
         self.camera = camera
         if reconnects:
@@ -32,15 +96,34 @@ class CameraGUI:
         self.set_exposure_button = tk.Button(master, text="Set Exposure", command=self.set_exposure)
         self.set_exposure_button.grid(row=1, column=2, padx=10, pady=10)
 
+        # ROI and binning controls, empty end fields mean the full sensor
+        self.roi_frame = tk.LabelFrame(master, text="ROI (pixels) / Binning")
+        self.roi_frame.grid(row=2, column=0, columnspan=3, padx=10, pady=5, sticky="ew")
+        roi = self.camera.get_roi()
+        self.roi_entries = {}
+        for n, key in enumerate(['hstart', 'hend', 'vstart', 'vend', 'hbin', 'vbin']):
+            tk.Label(self.roi_frame, text=f"{key}:").grid(row=n // 2, column=(n % 2) * 2, padx=5, pady=2, sticky="e")
+            entry = tk.Entry(self.roi_frame, width=8)
+            entry.insert(0, "" if roi[key] is None else str(roi[key]))
+            entry.grid(row=n // 2, column=(n % 2) * 2 + 1, padx=5, pady=2)
+            self.roi_entries[key] = entry
+
+        self.set_roi_button = tk.Button(self.roi_frame, text="Set ROI", command=self.set_roi)
+        self.set_roi_button.grid(row=0, column=4, padx=10, pady=2)
+        self.full_frame_button = tk.Button(self.roi_frame, text="Full Frame", command=self.clear_roi)
+        self.full_frame_button.grid(row=1, column=4, padx=10, pady=2)
+
         # Frame display label and the grab frame button in the same row
         self.frame_label = tk.Label(master, text="Grabbed Frame:")
-        self.frame_label.grid(row=2, column=0, padx=10, pady=10)
+        self.frame_label.grid(row=3, column=0, padx=10, pady=10)
 
         self.snap_button = tk.Button(master, text="Grab Frame", command=self.grab_frame)
-        self.snap_button.grid(row=2, column=1, padx=10, pady=10)  # Move the button to the left of the label
+        self.snap_button.grid(row=3, column=1, padx=10, pady=10)  # Move the button to the left of the label
 
-        self.canvas = tk.Canvas(master, width=640, height=480)
-        self.canvas.grid(row=3, column=0, columnspan=3, padx=10, pady=10)
+        # Frames grabbed here and, if given, frames published by a running scan
+        self.preview = preview or LatestFrame()
+        self.preview_canvas = PreviewCanvas(master, lambda: self.preview)
+        self.preview_canvas.grid(row=4, column=0, columnspan=3, padx=10, pady=10)
 
     def connect_camera(self):
         """Connect to the camera using the serial number."""
@@ -68,25 +151,45 @@ class CameraGUI:
             messagebox.showerror("Invalid Input", "Please enter a valid number for exposure.")
 
 
-    def grab_frame(self):
-        """Grab and display a frame from the camera."""
-        frame = self.camera.snap_image()
-        
-        if isinstance(frame, str):  # In case of a simulated image
-            messagebox.showinfo("Simulated Image", f"Simulated image: {frame}")
+    def set_roi(self):
+        """Apply the ROI and binning entered, empty fields use the defaults"""
+        defaults = {'hstart': 0, 'hend': None, 'vstart': 0, 'vend': None, 'hbin': 1, 'vbin': 1}
+        try:
+            values = {key: int(entry.get()) if entry.get().strip() else defaults[key]
+                      for key, entry in self.roi_entries.items()}
+        except ValueError:
+            messagebox.showerror("Invalid Input", "ROI and binning must be whole numbers.")
             return
-        
-        # Convert the frame to RGB (OpenCV uses BGR by default)
-        if frame.shape[2] == 1:  # If the frame is grayscale
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_GRAY2RGB)
+        self.show_roi(self.camera.set_roi(**values))
+
+    def clear_roi(self):
+        """Go back to the full sensor without binning"""
+        self.show_roi(self.camera.clear_roi())
 
-        # Convert to ImageTk format for displaying in Tkinter
-        img = Image.fromarray(frame_rgb)
-        img_tk = ImageTk.PhotoImage(image=img)
+    def show_roi(self, roi):
+        """Show the ROI the camera accepted, which may be rounded from what was entered"""
+        for key, entry in self.roi_entries.items():
+            entry.delete(0, tk.END)
+            entry.insert(0, "" if roi[key] is None else str(roi[key]))
 
-        # Update the canvas with the new image
-        self.canvas.create_image(0, 0, image=img_tk, anchor=tk.NW)
-        self.canvas.image = img_tk  # Keep a reference to avoid garbage collection
+    def grab_frame(self):
+        """Grab a frame in the background, the preview picks it up when it arrives"""
+        if self._grabbing:
+            return
+        self._grabbing = True
+        self.snap_button.config(state="disabled")
+        threading.Thread(target=self._grab, daemon=True).start()
+
+    def _grab(self):
+        try:
+            frame = self.camera.snap_image()
+            if isinstance(frame, str):  # In case of a simulated image
+                print(f"Simulated image: {frame}")
+            else:
+                self.preview.publish(frame, exposure=self.camera.exposure)
+        finally:
+            self._grabbing = False
+            self.master.after(0, lambda: self.snap_button.config(state="normal"))
 
 
 if __name__ == "__main__":
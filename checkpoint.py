@@ -0,0 +1,121 @@
+# checkpoint.py
+# progress file written during a scan so a crashed or cancelled scan can be resumed
+import os
+import datetime
+import json
+import threading
+import time
+
+
+class ScanCheckpoint:
+    """Small JSON record of a scan: settings, scan zero, output location and completed points
+
+    Completed indices are stored as [start, end) ranges and the point list
+    goes in a separate <checkpoint>_points.json written once, so the file
+    rewritten during the scan stays small. Writes are atomic (temporary
+    file + rename) and throttled to one every SAVE_INTERVAL seconds.
+    """
+    SAVE_INTERVAL = 2.0  # seconds
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = path
+        self.points_path = f"{os.path.splitext(path)[0]}_points.json"
+        self.parameters = {}
+        self.points = []
+        self.scan_zero = (0.0, 0.0)
+        self.output = {}
+        self.completed = set()
+        self.complete = False
+        self._last_save = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def filename(folder, prefix, suffix=''):
+        """Default checkpoint location for a scan saved with this folder, prefix and file suffix"""
+        return os.path.join(folder, f"{prefix}checkpoint{suffix}.json")
+
+    @classmethod
+    def load(cls, path):
+        """Read a checkpoint written by save()"""
+        with open(path, 'r') as f:
+            state = json.load(f)
+        checkpoint = cls(path)
+        with open(checkpoint.points_path, 'r') as f:
+            checkpoint.points = json.load(f)
+        checkpoint.parameters = state['parameters']
+        checkpoint.scan_zero = tuple(state['scan_zero'])
+        checkpoint.output = state['output']
+        checkpoint.completed = {i for start, end in state['completed'] for i in range(start, end)}
+        checkpoint.complete = state.get('complete', False)
+        return checkpoint
+
+    def begin(self, parameters, points, scan_zero, output):
+        """Record the scan set-up and write the first checkpoint"""
+        self.parameters = parameters
+        self.points = [list(map(float, p)) for p in points]
+        self.scan_zero = tuple(scan_zero)
+        self.output = output
+        self.complete = False
+        self._write_json(self.points_path, self.points)
+        self.save()
+
+    def add_points(self, points):
+        """Append points chosen during the scan, e.g. by adaptive refinement"""
+        self.points.extend(list(map(float, p)) for p in points)
+        self._write_json(self.points_path, self.points)
+        self.save()
+
+    def mark_done(self, index):
+        """Record that a point has been saved, safe to call from writer threads"""
+        with self._lock:
+            self.completed.add(index)
+        if time.monotonic() - self._last_save > self.SAVE_INTERVAL:
+            self.save()
+
+    def first_missing(self):
+        """Index of the first point that has not been saved, None if all are done"""
+        for i in range(len(self.points)):
+            if i not in self.completed:
+                return i
+        return None
+
+    def finish(self):
+        """Mark the scan as complete and write the final checkpoint"""
+        self.complete = self.first_missing() is None
+        self.save()
+
+    def save(self):
+        """Atomically write the checkpoint file"""
+        with self._lock:
+            state = {
+                'version': self.VERSION,
+                'updated': datetime.datetime.now().isoformat(),
+                'complete': self.complete,
+                'parameters': self.parameters,
+                'scan_zero': list(self.scan_zero),
+                'output': self.output,
+                'completed': self._to_ranges(self.completed),
+            }
+            self._last_save = time.monotonic()
+            self._write_json(self.path, state)
+
+    @staticmethod
+    def _write_json(path, data):
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, path)
+        except (IOError, TypeError) as e:
+            print(f"Error saving checkpoint to '{path}': {e}")
+
+    @staticmethod
+    def _to_ranges(indices):
+        ranges = []
+        for i in sorted(indices):
+            if ranges and ranges[-1][1] == i:
+                ranges[-1][1] = i + 1
+            else:
+                ranges.append([i, i + 1])
+        return ranges
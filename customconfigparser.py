@@ -1,29 +1,114 @@
 from pathlib import Path
 
+import atexit
 import json
+import os
+import tempfile
+import threading
+import time
+import weakref
+
+
+_parsers = weakref.WeakSet()  # live parsers, flushed at interpreter exit
+
+
+@atexit.register
+def _flush_all():
+    for parser in list(_parsers):
+        parser.flush()
 
 
 class ConfigParser:
+    """JSON config file of one device, held in memory
+
+    The file is parsed once and re-read only when its modification time
+    changes, checked at most every CHECK_INTERVAL seconds, so get_entry is a
+    dictionary lookup on the hot path. write_entry updates the memory copy
+    straight away and writes the file WRITE_DELAY seconds later, batching
+    the entries written in between into one atomic replace of the file.
+    Call flush() to write immediately; pending entries are also written at
+    interpreter exit.
+    """
     CONFIG_PATH = 'config'
+    CHECK_INTERVAL = 1.0  # s between mtime checks of the file
+    WRITE_DELAY = 0.5  # s to collect entries before writing them
 
     def __init__(self, name: str):
         self.name = name
+        self.version = 0  # incremented whenever the in-memory config changes
+        self._cfg = None
+        self._mtime = None
+        self._checked = 0.0
+        self._pending = {}
+        self._timer = None
+        self._lock = threading.RLock()
+        _parsers.add(self)
 
     def get_entry(self, key: str):
-        cfg = self.read_config()
+        cfg = self._read_config()
         if cfg is None:
             return None
 
         return cfg.get(key, None)
 
     def write_entry(self, cfg_dict):
-        cfg = self.read_config()
-        for key, value in cfg_dict.items():
-            cfg[key] = value
-
-        self.write_config(cfg)
+        with self._lock:
+            cfg = self._read_config()
+            for key, value in cfg_dict.items():
+                cfg[key] = value
+                self._pending[key] = value
+            self.version += 1
+            if self._timer is None:
+                self._timer = threading.Timer(self.WRITE_DELAY, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
 
     def read_config(self):
+        """Copy of the config, re-parsed if the file changed on disk"""
+        with self._lock:
+            return dict(self._read_config())
+
+    def _read_config(self):
+        """The cached config itself, callers must not modify it outside the lock"""
+        with self._lock:
+            now = time.monotonic()
+            if self._cfg is not None and now - self._checked < self.CHECK_INTERVAL:
+                return self._cfg
+            self._checked = now
+            mtime = self._file_mtime()
+            if self._cfg is None or mtime != self._mtime:
+                cfg = self._load()
+                # Entries not written yet win over the file
+                cfg.update(self._pending)
+                self._cfg = cfg
+                self._mtime = mtime
+                self.version += 1
+            return self._cfg
+
+    def write_config(self, cfg):
+        """Replace the whole config and write it now"""
+        with self._lock:
+            self._cfg = dict(cfg)
+            self._pending = {}
+            self.version += 1
+            return self._write(self._cfg)
+
+    def flush(self):
+        """Write pending entries now, merged into the current file contents"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return
+            # Keep entries other processes wrote since the last read
+            cfg = self._load() if self._file_mtime() != self._mtime else dict(self._cfg)
+            cfg.update(self._pending)
+            self._pending = {}
+            self._cfg = cfg
+            self._write(cfg)
+
+    def _load(self):
         try:
             filename = self.get_config_filename()
             path = self.get_path(filename)
@@ -32,17 +117,33 @@ class ConfigParser:
         except (IOError, json.decoder.JSONDecodeError):
             return {}
 
-    def write_config(self, cfg):
+    def _write(self, cfg):
+        """Write to a temporary file and rename it over the config so readers never see half a file"""
+        filename = self.get_config_filename()
+        p = self.get_path(filename)
         try:
-            filename = self.get_config_filename()
-            with open(self.get_path(filename), 'w') as f:
-                return json.dump(cfg, f, ensure_ascii=False, indent=4)
+            p.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=p.parent, prefix=f'.{filename}.', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(cfg, f, ensure_ascii=False, indent=4)
+                os.replace(tmp, p)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+            self._mtime = self._file_mtime()
+            self._checked = time.monotonic()
+            return True
         except IOError:
-            filename = self.get_config_filename()
-            p = self.get_path(filename)
             print(f"Error writing config to '{p}'")
             return None
 
+    def _file_mtime(self):
+        try:
+            return os.stat(self.get_path(self.get_config_filename())).st_mtime_ns
+        except OSError:
+            return None
+
     def get_config_filename(self):
         return f'cfg_{self.name}.json'
 
@@ -0,0 +1,114 @@
+# devicestate.py
+# one cached view of each controller's state, shared by the GUI, monitors and the scan
+import threading
+import time
+
+
+class DeviceState:
+    """Snapshot of a controller, timestamp is the time.monotonic() of the position it holds"""
+    def __init__(self, position=None, moving=False, status=None, timestamp=0.0, error=''):
+        self.position = position
+        self.moving = moving
+        self.status = status  # controller specific status object, e.g. AxisStatus
+        self.timestamp = timestamp
+        self.error = error
+
+    @property
+    def age(self):
+        return time.monotonic() - self.timestamp
+
+    def to_dict(self):
+        return {'position': self.position, 'moving': self.moving, 'timestamp': self.timestamp, 'error': self.error}
+
+
+class DeviceStateCache:
+    """Owns the state reads of one controller
+
+    Consumers call get(max_age) and reuse the cached snapshot while it is
+    fresh enough, so a monitor polling at 1 s and a GUI label add no bus
+    traffic while a scan is already reading the stage. refresh() forces a
+    read, and concurrent refreshes are coalesced: a thread that waited for
+    another thread's read uses that result instead of reading again.
+    Subscribers are called with every new snapshot, from the thread that
+    produced it.
+
+    Args:
+        name: device name for messages
+        reader: callable returning a dict with any of position, moving and status
+    """
+    def __init__(self, name, reader):
+        self.name = name
+        self.reader = reader
+        self.state = DeviceState()
+        self.reads = 0  # controller reads actually issued
+        self._read_time = 0.0  # when the last controller read finished
+        self._read_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        """Call callback(state) with every new snapshot"""
+        with self._state_lock:
+            self._subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._state_lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def get(self, max_age=None):
+        """Cached snapshot, read from the controller if older than max_age seconds (None: never)"""
+        state = self.state
+        if max_age is None or state.age <= max_age:
+            return state
+        return self.refresh()
+
+    def refresh(self):
+        """Read the controller now, or share a read that finished while waiting for the lock"""
+        requested = time.monotonic()
+        with self._read_lock:
+            if self._read_time >= requested:
+                return self.state
+            try:
+                values = self.reader()
+                values.setdefault('error', '')
+            except Exception as e:
+                print(f"Error reading {self.name} state: {e}")
+                # Nothing is known about the motion, stop anyone polling for it from spinning
+                values = {'error': str(e), 'moving': False}
+            self.reads += 1
+            state = self.update(**values)
+            self._read_time = time.monotonic()
+            return state
+
+    def update(self, **values):
+        """Store values known without a read (a finished move) and notify subscribers
+
+        The timestamp only moves on when a position is given, so other
+        values never make an old position look fresh.
+        """
+        return self._store(values, time.monotonic() if 'position' in values else None)
+
+    def command(self, **values):
+        """Record a commanded change, the cached position is stale until the next read"""
+        return self._store(values, 0.0)
+
+    def _store(self, values, timestamp):
+        with self._state_lock:
+            previous = self.state
+            self.state = DeviceState(
+                position=values.get('position', previous.position),
+                moving=values.get('moving', previous.moving),
+                status=values.get('status', previous.status),
+                timestamp=previous.timestamp if timestamp is None else timestamp,
+                error=values.get('error', previous.error),
+            )
+            state = self.state
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(state)
+            except Exception as e:
+                print(f"Error in {self.name} state subscriber: {e}")
+        return state
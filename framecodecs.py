@@ -0,0 +1,117 @@
+# framecodecs.py
+# lossless encoders for frames saved one file per point: PNG, TIFF and blosc
+import io
+import json
+import struct
+import cv2
+import numpy as np
+
+try:
+    import tifffile
+except ImportError:
+    tifffile = None
+
+try:
+    import blosc2
+    blosc = None
+except ImportError:
+    blosc2 = None
+    try:
+        import blosc
+    except ImportError:
+        blosc = None
+
+
+class FrameCodec:
+    """Encodes frames to the bytes of one file
+
+    Args:
+        format: "png", "tiff" or "blosc"
+        compression: algorithm within the format, None for the format's default
+            png: "deflate" (the only PNG compression), "none" stores level 0
+            tiff: "none", "zlib", "zstd", "lzma" (zstd needs the imagecodecs package)
+            blosc: "lz4", "lz4hc", "zstd", "zlib", "blosclz"
+        level: compression level, None for the default of the algorithm (for PNG
+            no level is passed, leaving OpenCV on its speed-tuned default)
+    """
+    COMPRESSIONS = {
+        'png': ('deflate', 'none'),
+        'tiff': ('none', 'zlib', 'zstd', 'lzma'),
+        'blosc': ('lz4', 'lz4hc', 'zstd', 'zlib', 'blosclz'),
+    }
+    EXTENSIONS = {'png': '.png', 'tiff': '.tif', 'blosc': '.blosc'}
+    DEFAULT_LEVELS = {'png': None, 'tiff': 6, 'blosc': 5}
+    BLOSC_MAGIC = b'BLSC'
+
+    def __init__(self, format='png', compression=None, level=None):
+        if format not in self.COMPRESSIONS:
+            raise ValueError(f"Unknown frame format '{format}', expected one of {tuple(self.COMPRESSIONS)}")
+        compression = compression or self.COMPRESSIONS[format][0]
+        if compression not in self.COMPRESSIONS[format]:
+            raise ValueError(f"Unknown {format} compression '{compression}', "
+                             f"expected one of {self.COMPRESSIONS[format]}")
+        if format == 'tiff' and tifffile is None:
+            raise ImportError("TIFF output needs the tifffile package")
+        if format == 'blosc' and blosc2 is None and blosc is None:
+            raise ImportError("Blosc output needs the blosc2 or blosc package")
+        self.format = format
+        self.compression = compression
+        self.level = self.DEFAULT_LEVELS[format] if level is None else int(level)
+        if format == 'png' and compression == 'none':
+            self.level = 0
+        if format == 'tiff' and compression == 'none':
+            self.level = None
+        self.extension = self.EXTENSIONS[format]
+        # Fail now rather than on the first frame of a scan if a plugin is missing
+        try:
+            self.encode(np.zeros((2, 2), dtype=np.uint16))
+        except Exception as e:
+            raise ImportError(f"{format} {compression} compression is not available: {e}")
+
+    def describe(self):
+        return {'format': self.format, 'compression': self.compression, 'level': self.level}
+
+    def encode(self, image):
+        """Bytes of the file holding image"""
+        if self.format == 'png':
+            params = [] if self.level is None else [cv2.IMWRITE_PNG_COMPRESSION, self.level]
+            success, encoded = cv2.imencode('.png', image, params)
+            if not success:
+                raise ValueError("PNG encoding failed")
+            return encoded.tobytes()
+        if self.format == 'tiff':
+            buffer = io.BytesIO()
+            if self.compression == 'none':
+                tifffile.imwrite(buffer, image)
+            else:
+                tifffile.imwrite(buffer, image, compression=self.compression,
+                                 compressionargs={'level': self.level})
+            return buffer.getvalue()
+        return self._encode_blosc(np.ascontiguousarray(image))
+
+    def _encode_blosc(self, image):
+        """Header with shape and dtype followed by the shuffled, compressed pixel buffer"""
+        if blosc2 is not None:
+            payload = blosc2.compress(image.tobytes(), typesize=image.dtype.itemsize, clevel=self.level,
+                                      filter=blosc2.Filter.SHUFFLE,
+                                      codec=getattr(blosc2.Codec, self.compression.upper()))
+        else:
+            payload = blosc.compress(image.tobytes(), typesize=image.dtype.itemsize, clevel=self.level,
+                                     shuffle=blosc.SHUFFLE, cname=self.compression)
+        header = json.dumps({'shape': list(image.shape), 'dtype': image.dtype.str}).encode()
+        return self.BLOSC_MAGIC + struct.pack('<I', len(header)) + header + payload
+
+
+def read_frame(path):
+    """Load a frame saved by FrameCodec from its file"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:4] == FrameCodec.BLOSC_MAGIC:
+        length = struct.unpack('<I', data[4:8])[0]
+        header = json.loads(data[8:8 + length])
+        payload = data[8 + length:]
+        raw = blosc2.decompress(payload) if blosc2 is not None else blosc.decompress(payload)
+        return np.frombuffer(raw, dtype=header['dtype']).reshape(header['shape'])
+    if path.lower().endswith(('.tif', '.tiff')):
+        return tifffile.imread(path)
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
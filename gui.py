@@ -2,16 +2,24 @@
 import tkinter as tk
 from tkinter import ttk, simpledialog, messagebox, StringVar, filedialog
 import threading
+import numpy as np
 from pylablib.devices import Thorlabs
 from camera import Camera
-from cameragui import CameraGUI
+from cameragui import CameraGUI, PreviewCanvas
 from stage import Stage
 from xStage import XiStage, default_params
 import libximc.highlevel as ximc  # Import for Standa stage enumeration
 from stagegui import StageGUI
 from scan import Scan, Scanner_Backend
+from settle import SettlePolicy
+from h5writer import Hdf5Writer
+from framecodecs import FrameCodec
 
 class ImagingApp:
+    # Output format labels shown in the scan tab and the Scan.output_format they select
+    OUTPUT_FORMATS = {"PNG + TXT": "png", "TIFF + TXT": "tiff", "Blosc + TXT": "blosc", "HDF5": "hdf5",
+                      "Raw NPY stack": "npy"}
+
     def __init__(self, root):
         self.root = root
         self.root.title("XY Imaging Application")
@@ -330,10 +338,55 @@ class ImagingApp:
         ttk.Radiobutton(pattern_frame, text="Ladder Pattern", variable=self.pattern_var, 
                        value=False).pack(side="left", padx=5)
         
+        # Arbitrary point list instead of the grid
+        self.loaded_points = None
+        ttk.Button(param_frame, text="Load Point List", command=self.load_point_list).grid(
+            row=0, column=2, padx=5, pady=5)
+        ttk.Button(param_frame, text="Use Grid", command=self.clear_point_list).grid(
+            row=0, column=3, padx=5, pady=5)
+        self.points_label = ttk.Label(param_frame, text="Using grid")
+        self.points_label.grid(row=1, column=2, columnspan=2, padx=5, pady=5, sticky="w")
+        self.optimize_path_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(param_frame, text="Optimize path order", variable=self.optimize_path_var).grid(
+            row=2, column=2, columnspan=2, padx=5, pady=5, sticky="w")
+
+        # Camera ROI the scan will record, set in the Camera Control tab
+        self.roi_label = ttk.Label(param_frame, text="Camera ROI: full sensor")
+        self.roi_label.grid(row=3, column=2, columnspan=2, padx=5, pady=5, sticky="w")
+
         # Apply button
         ttk.Button(param_frame, text="Apply Settings", command=self.apply_scan_settings).grid(
             row=5, column=0, columnspan=2, padx=5, pady=10)
         
+        # Settle frame
+        settle_frame = ttk.LabelFrame(parent, text="Settle After Move")
+        settle_frame.pack(fill="x", padx=10, pady=5)
+
+        ttk.Label(settle_frame, text="Mode:").grid(row=0, column=0, padx=5, pady=5, sticky="w")
+        self.settle_mode_var = StringVar(value="zero")
+        ttk.Combobox(settle_frame, textvariable=self.settle_mode_var, values=list(SettlePolicy.MODES),
+                     state="readonly", width=12).grid(row=0, column=1, padx=5, pady=5)
+
+        ttk.Label(settle_frame, text="Time (s):").grid(row=0, column=2, padx=5, pady=5, sticky="w")
+        self.settle_time_entry = ttk.Entry(settle_frame, width=8)
+        self.settle_time_entry.insert(0, "0.0")
+        self.settle_time_entry.grid(row=0, column=3, padx=5, pady=5)
+
+        ttk.Label(settle_frame, text="Time per unit (s):").grid(row=0, column=4, padx=5, pady=5, sticky="w")
+        self.settle_per_unit_entry = ttk.Entry(settle_frame, width=8)
+        self.settle_per_unit_entry.insert(0, "0.0")
+        self.settle_per_unit_entry.grid(row=0, column=5, padx=5, pady=5)
+
+        ttk.Label(settle_frame, text="Tolerance:").grid(row=1, column=2, padx=5, pady=5, sticky="w")
+        self.settle_tolerance_entry = ttk.Entry(settle_frame, width=8)
+        self.settle_tolerance_entry.insert(0, "0.001")
+        self.settle_tolerance_entry.grid(row=1, column=3, padx=5, pady=5)
+
+        ttk.Label(settle_frame, text="Timeout (s):").grid(row=1, column=4, padx=5, pady=5, sticky="w")
+        self.settle_timeout_entry = ttk.Entry(settle_frame, width=8)
+        self.settle_timeout_entry.insert(0, "2.0")
+        self.settle_timeout_entry.grid(row=1, column=5, padx=5, pady=5)
+
         # output frame
         save_frame = ttk.LabelFrame(parent, text="Image Saving Config")
         save_frame.pack(fill="x", padx=10, pady=5)
@@ -372,6 +425,27 @@ class ImagingApp:
         # Configure column weights for proper expansion
         prefix_frame.columnconfigure(1, weight=1)
 
+        # Output format
+        format_frame = ttk.Frame(save_frame)
+        format_frame.pack(fill="x", padx=10, pady=5)
+
+        ttk.Label(format_frame, text="Output Format:").grid(row=0, column=0, padx=5, pady=5, sticky="w")
+        self.output_format_var = StringVar(value="PNG + TXT")
+        format_combo = ttk.Combobox(format_frame, textvariable=self.output_format_var, values=list(self.OUTPUT_FORMATS),
+                                    state="readonly", width=12)
+        format_combo.grid(row=0, column=1, padx=5, pady=5)
+        format_combo.bind("<<ComboboxSelected>>", lambda e: self.update_compression_options())
+
+        ttk.Label(format_frame, text="Compression:").grid(row=0, column=2, padx=5, pady=5, sticky="w")
+        self.compression_var = StringVar(value="default")
+        self.compression_combo = ttk.Combobox(format_frame, textvariable=self.compression_var, state="readonly", width=8)
+        self.compression_combo.grid(row=0, column=3, padx=5, pady=5)
+
+        ttk.Label(format_frame, text="Level:").grid(row=0, column=4, padx=5, pady=5, sticky="w")
+        self.compression_level_var = StringVar(value="")
+        ttk.Entry(format_frame, textvariable=self.compression_level_var, width=4).grid(row=0, column=5, padx=5, pady=5)
+        self.update_compression_options()
+
         # Save options
         options_frame = ttk.Frame(save_frame)
         options_frame.pack(fill="x", padx=10, pady=5)
@@ -420,6 +494,10 @@ class ImagingApp:
         self.cancel_button = ttk.Button(control_frame, text="Cancel", command=self.cancel_scan, state="disabled")
         self.cancel_button.grid(row=0, column=3, padx=5, pady=10)
         
+        self.resume_checkpoint_button = ttk.Button(control_frame, text="Resume From Checkpoint",
+                                                   command=self.resume_from_checkpoint)
+        self.resume_checkpoint_button.grid(row=0, column=4, padx=5, pady=10)
+        
         # Status frame
         status_frame = ttk.Frame(parent)
         status_frame.pack(fill="x", padx=10, pady=10)
@@ -433,17 +511,64 @@ class ImagingApp:
         self.progress_bar = ttk.Progressbar(status_frame, variable=self.progress_var, length=200)
         self.progress_bar.grid(row=1, column=1, padx=5, pady=5, sticky="w")
         
+        # Live preview of the running scan, it follows the scan object when hardware is reconnected
+        preview_frame = ttk.LabelFrame(parent, text="Live Preview")
+        preview_frame.pack(fill="both", expand=True, padx=10, pady=5)
+        self.scan_preview = PreviewCanvas(preview_frame, lambda: self.backend.scan.preview if self.backend.scan else None,
+                                          width=320, height=240)
+        self.scan_preview.pack(padx=5, pady=5)
 
         # Check if scan is possible
         self.update_scan_ui_state()
     
 
+    def load_point_list(self):
+        """Load x, y offsets from the scan start (one point per line) to scan instead of the grid"""
+        path = filedialog.askopenfilename(filetypes=[("Point lists", "*.csv *.txt"), ("All files", "*.*")])
+        if not path:
+            return
+        try:
+            with open(path) as f:
+                delimiter = ',' if ',' in f.readline() else None
+            points = np.loadtxt(path, delimiter=delimiter, ndmin=2)[:, :2]
+        except (IOError, ValueError, IndexError) as e:
+            messagebox.showerror("Error", f"Failed to load point list: {e}")
+            return
+        self.loaded_points = points
+        self.points_label.config(text=f"{len(points)} points from {path.split('/')[-1]}")
+
+    def clear_point_list(self):
+        """Scan the rectangular grid again"""
+        self.loaded_points = None
+        self.points_label.config(text="Using grid")
+
+    def update_compression_options(self):
+        """Offer the compressions of the selected output format"""
+        output_format = self.OUTPUT_FORMATS[self.output_format_var.get()]
+        if output_format == "hdf5":
+            options = list(Hdf5Writer.COMPRESSIONS)
+        elif output_format in FrameCodec.COMPRESSIONS:
+            options = list(FrameCodec.COMPRESSIONS[output_format])
+        else:
+            options = []
+        self.compression_combo['values'] = ["default"] + options
+        self.compression_var.set("default")
+
     def apply_save_settings(self):
         """Apply the image saving settings to the scanner"""
         folder = self.folder_var.get()
         prefix = self.prefix_var.get()
         auto_save = self.auto_save_var.get()
         overwrite = self.overwrite_var.get()
+        output_format = self.OUTPUT_FORMATS[self.output_format_var.get()]
+        compression = self.compression_var.get()
+        compression = None if compression == "default" else compression
+        try:
+            level = self.compression_level_var.get().strip()
+            compression_level = int(level) if level else None
+        except ValueError:
+            messagebox.showerror("Error", "Compression level must be a whole number")
+            return
         
         # Validate folder path
         if not folder:
@@ -456,7 +581,8 @@ class ImagingApp:
             return
         
         # Apply settings to scanner backend
-        success = self.backend.setup_scan_saving(folder, prefix, auto_save, overwrite)
+        success = self.backend.setup_scan_saving(folder, prefix, auto_save, overwrite, output_format, compression,
+                                                 compression_level)
         
         if success:
             messagebox.showinfo("Success", "Image saving settings applied")
@@ -600,7 +726,8 @@ class ImagingApp:
     def refresh_scan_object(self):
         """Recreate the scan object with current hardware"""
         # Recreate scan with current hardware
-        self.backend.scan = Scan(self.backend.camera, self.backend.x_stage, self.backend.y_stage)
+        self.backend.scan = Scan(self.backend.camera, self.backend.x_stage, self.backend.y_stage,
+                                 self.backend.cameras)
     
     def reset_hardware(self):
         """Reset all hardware connections"""
@@ -632,13 +759,8 @@ class ImagingApp:
             # Close existing hardware
             self.backend.close()
             
-            # Create new backend with simulation mode
-            self.backend = Scanner_Backend()
-            
-            # Create simulation devices
-            self.backend.x_stage = Stage("X")  # No SN = simulation
-            self.backend.y_stage = Stage("Y")  # No SN = simulation
-            self.backend.camera = Camera()  # No SN = simulation
+            # Create new backend with timing-realistic simulated stages and camera
+            self.backend = Scanner_Backend(simulate=True)
             
             # Refresh scan object
             self.refresh_scan_object()
@@ -664,15 +786,42 @@ class ImagingApp:
             res_x = float(self.res_x_entry.get())
             res_y = float(self.res_y_entry.get())
             pattern = self.pattern_var.get()
+            settle = SettlePolicy(mode=self.settle_mode_var.get(),
+                                  settle_time=float(self.settle_time_entry.get()),
+                                  settle_per_unit=float(self.settle_per_unit_entry.get()),
+                                  tolerance=float(self.settle_tolerance_entry.get()),
+                                  timeout=float(self.settle_timeout_entry.get()))
             
             if self.backend.scan:
                 self.backend.scan.setup_scan(num_x, num_y, res_x, res_y, pattern)
+                if self.loaded_points is not None:
+                    self.backend.scan.setup_points(self.loaded_points, self.optimize_path_var.get())
+                else:
+                    self.backend.scan.clear_points()
+                self.backend.scan.setup_settle(settle)
+                self.update_roi_label()
                 self.scan_status.config(text="Settings applied")
             else:
                 self.scan_status.config(text="Error: No scan object available")
         except ValueError:
             self.scan_status.config(text="Invalid parameters")
     
+    def update_roi_label(self):
+        """Show the camera ROI and binning that will be stored with the scan"""
+        if self.backend.camera is None:
+            return
+        roi = self.backend.camera.get_roi()
+        # Camera reports an open end as None, SimCamera as the sensor size
+        width, height = self.backend.camera.get_detector_size()
+        full = (roi['hstart'] == 0 and roi['vstart'] == 0 and roi['hend'] in (None, width)
+                and roi['vend'] in (None, height))
+        if full and roi['hbin'] == roi['vbin'] == 1:
+            text = "Camera ROI: full sensor"
+        else:
+            text = (f"Camera ROI: x {roi['hstart']}-{roi['hend'] or 'end'}, y {roi['vstart']}-{roi['vend'] or 'end'}, "
+                    f"binning {roi['hbin']}x{roi['vbin']}")
+        self.roi_label.config(text=text)
+
     def update_scan_ui_state(self):
         """Update the scan UI based on available hardware"""
         scan_ready = (self.backend.camera is not None and
@@ -707,10 +856,43 @@ class ImagingApp:
         self.resume_button.config(state="disabled")
         self.scan_status.config(text="Scanning...")
     
-    def _run_scan(self):
+    def resume_from_checkpoint(self):
+        """Continue an interrupted scan from its checkpoint file"""
+        if not self.backend.scan:
+            messagebox.showerror("Scan Error", "No scan object available")
+            return
+        if str(self.start_button['state']) == "disabled":
+            messagebox.showerror("Scan Error", "Connect the scan hardware (or a scan is already running)")
+            return
+        
+        path = filedialog.askopenfilename(title="Select scan checkpoint",
+                                          filetypes=[("Scan checkpoints", "*checkpoint*.json"), ("All files", "*.*")])
+        if not path:
+            return
+        try:
+            first_missing = self.backend.scan.load_checkpoint(path)
+        except (IOError, KeyError, ValueError) as e:
+            messagebox.showerror("Resume Error", f"Failed to load checkpoint: {e}")
+            return
+        if first_missing is None:
+            messagebox.showinfo("Resume", "This scan is already complete")
+            return
+        
+        # Resume in a separate thread, the output is verified before any point is retaken
+        self.scan_thread = threading.Thread(target=self._run_scan, kwargs={'resume': True})
+        self.scan_thread.daemon = True
+        self.scan_thread.start()
+        
+        self.start_button.config(state="disabled")
+        self.pause_button.config(state="normal")
+        self.cancel_button.config(state="normal")
+        self.resume_button.config(state="disabled")
+        self.scan_status.config(text=f"Resuming from point {first_missing}...")
+    
+    def _run_scan(self, resume=False):
         """Run the scan in a background thread"""
         try:
-            self.backend.scan.start_scan()
+            self.backend.scan.start_scan(resume=resume)
             
             # Update UI when scan is complete
             if not self.backend.scan.is_running:
@@ -759,7 +941,7 @@ class ImagingApp:
         """Update the progress bar based on scan progress"""
         if self.backend.scan and self.backend.scan.is_running:
             current = self.backend.scan.current_image
-            total = self.backend.scan.num_x * self.backend.scan.num_y
+            total = self.backend.scan.num_points
             if total > 0:  # Avoid division by zero
                 progress = (current / total) * 100
                 self.progress_var.set(progress)
@@ -0,0 +1,209 @@
+# h5writer.py
+# single-file scan output: all frames in one chunked dataset of a NeXus style HDF5 file
+import os
+import datetime
+import json
+import time
+import numpy as np
+
+from writer import compression_stats
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+
+class Hdf5Writer:
+    """Appends frames to one chunked (N, H, W) dataset with per-frame metadata arrays
+
+    Layout:
+        /entry (NXentry)            scan parameters as attributes
+        /entry/data (NXdata)
+            data                    frames, one chunk per frame
+            <metadata key>          one array per metadata key, parallel to data
+    """
+    # h5py files must only be written from one thread
+    max_workers = 1
+    COMPRESSIONS = ('none', 'gzip', 'lzf')
+    GROW_BY = 64  # frames added each time the datasets run out of space
+    FLUSH_EVERY = 16  # frames between flushes so a crash loses little data
+
+    def __init__(self, folder, prefix, overwrite=False, compression='none', compression_level=None,
+                 expected_frames=None, resume_from=None):
+        if h5py is None:
+            raise ImportError("h5py is required for HDF5 output")
+        if compression not in self.COMPRESSIONS:
+            raise ValueError(f"Unknown compression '{compression}', expected one of {self.COMPRESSIONS}")
+        self.compression = None if compression == 'none' else compression
+        if compression_level is None:
+            compression_level = 4
+        self.compression_level = compression_level if compression == 'gzip' else None
+        self.expected_frames = expected_frames or self.GROW_BY
+        self._stats = None
+
+        if resume_from:
+            self._open_existing(resume_from)
+            return
+
+        # The prefix names the file, e.g. scan_ gives scan.h5 and scan_near_ gives scan_near.h5
+        name = prefix.rstrip('_') or 'scan'
+        filepath = os.path.join(folder, f"{name}.h5")
+        if os.path.exists(filepath) and not overwrite:
+            timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+            filepath = os.path.join(folder, f"{name}_{timestamp}.h5")
+            print(f"File already exists. Saving as {filepath} instead")
+        self.filepath = filepath
+        self.location = filepath
+
+        self.file = h5py.File(filepath, 'w')
+        self.entry = self.file.create_group('entry')
+        self.entry.attrs['NX_class'] = 'NXentry'
+        self.data = self.entry.create_group('data')
+        self.data.attrs['NX_class'] = 'NXdata'
+        self.data.attrs['signal'] = 'data'
+        self.frames = None
+        self.columns = {}
+        self.count = 0
+        print(f"Saving scan to {filepath}")
+
+    def _open_existing(self, filepath):
+        """Reopen a file from an interrupted scan to append the missing frames"""
+        self.filepath = filepath
+        self.location = filepath
+        self.file = h5py.File(filepath, 'a')
+        self.entry = self.file['entry']
+        self.data = self.entry['data']
+        self.frames = self.data.get('data')
+        self.columns = {name: dataset for name, dataset in self.data.items() if name != 'data'}
+        self.count = int(self.data.attrs.get('frames_written', 0))
+        print(f"Resuming scan in {filepath} after {self.count} frames")
+
+    def written_indices(self):
+        """Indices of the frames already stored in the file"""
+        if 'index' not in self.columns:
+            return set()
+        return set(int(i) for i in self.columns['index'][:self.count])
+
+    def write_parameters(self, parameters):
+        """Store the scan parameters as attributes of the entry group"""
+        for key, value in parameters.items():
+            if isinstance(value, dict):
+                # Nested settings (e.g. settle policy) are kept as JSON strings
+                value = json.dumps(value)
+            elif value is None:
+                value = 'None'
+            self.entry.attrs[key] = value
+
+    def write(self, image_data, index, metadata, timings=None):
+        """Append a frame and its metadata, compression is counted as write time
+
+        Returns:
+            location: 'file:row' of the stored frame or None if saving failed
+        """
+        try:
+            image_data = np.asarray(image_data)
+            if self.frames is None:
+                self._create_frames(image_data)
+            if self.count >= self.frames.shape[0]:
+                self._grow()
+
+            start = time.perf_counter()
+            self.frames[self.count] = image_data
+            written_at = time.perf_counter()
+            columns = {'index': index}
+            columns.update((self._column_name(key), value) for key, value in metadata.items())
+            for name, value in columns.items():
+                if value is not None:
+                    self._write_column(name, value)
+            self.count += 1
+            self.data.attrs['frames_written'] = self.count
+            if self.count % self.FLUSH_EVERY == 0:
+                self.file.flush()
+            if timings is not None:
+                timings.add('write', written_at - start)
+                timings.add('metadata', time.perf_counter() - written_at)
+            return f"{self.filepath}:{self.count - 1}"
+
+        except Exception as e:
+            print(f"Error saving image: {e}")
+            return None
+
+    def compression_stats(self):
+        """Frames, raw and stored bytes and compression ratio of the frame dataset"""
+        if self.file is None:
+            return self._stats
+        raw_bytes = stored_bytes = 0
+        if self.frames is not None:
+            raw_bytes = self.count * int(np.prod(self.frames.shape[1:])) * self.frames.dtype.itemsize
+            stored_bytes = self.frames.id.get_storage_size()
+        codec = {'format': 'hdf5', 'compression': self.compression or 'none', 'level': self.compression_level}
+        return compression_stats(codec, self.count, raw_bytes, stored_bytes)
+
+    def close(self):
+        """Trim the datasets to the frames written and close the file"""
+        if self.file is None:
+            return
+        try:
+            if self.frames is not None:
+                self.frames.resize(self.count, axis=0)
+            for column in self.columns.values():
+                column.resize(self.count, axis=0)
+            self._stats = self.compression_stats()
+            self.file.close()
+            print(f"Saved {self.count} frames to {self.filepath}")
+        except Exception as e:
+            print(f"Error closing {self.filepath}: {e}")
+        finally:
+            self.file = None
+
+    def _create_frames(self, image_data):
+        self.frames = self.data.create_dataset(
+            'data',
+            shape=(self.expected_frames,) + image_data.shape,
+            maxshape=(None,) + image_data.shape,
+            dtype=image_data.dtype,
+            chunks=(1,) + image_data.shape,
+            compression=self.compression,
+            compression_opts=self.compression_level,
+        )
+
+    def _grow(self):
+        size = self.frames.shape[0] + self.GROW_BY
+        self.frames.resize(size, axis=0)
+        for column in self.columns.values():
+            column.resize(size, axis=0)
+
+    def _write_column(self, name, value):
+        if isinstance(value, (list, tuple, np.ndarray)):
+            self._write_array_column(name, np.asarray(value))
+            return
+        if name not in self.columns:
+            if isinstance(value, str):
+                dtype = h5py.string_dtype()
+            elif isinstance(value, (bool, np.bool_)):
+                dtype = np.bool_
+            elif isinstance(value, (int, np.integer)):
+                dtype = np.int64
+            else:
+                dtype = np.float64
+            self.columns[name] = self.data.create_dataset(
+                name, shape=(self.frames.shape[0],), maxshape=(None,), dtype=dtype)
+        self.columns[name][self.count] = value
+
+    def _write_array_column(self, name, value):
+        """Numeric list or array values go in a column with one row per frame"""
+        if not np.issubdtype(value.dtype, np.number) and value.dtype != np.bool_:
+            raise ValueError(f"Metadata '{name}' holds non-numeric values {value.tolist()}, store it as a string")
+        if name not in self.columns:
+            self.columns[name] = self.data.create_dataset(
+                name, shape=(self.frames.shape[0],) + value.shape, maxshape=(None,) + value.shape,
+                dtype=value.dtype if value.dtype == np.bool_ else np.float64)
+        column = self.columns[name]
+        if column.shape[1:] != value.shape:
+            raise ValueError(f"Metadata '{name}' has shape {value.shape}, its column holds {column.shape[1:]}")
+        column[self.count] = value
+
+    @staticmethod
+    def _column_name(key):
+        return key.strip().lower().replace(' ', '_')
@@ -0,0 +1,81 @@
+# hdr.py
+# merge of exposure brackets taken at one scan point into a single high-dynamic-range frame
+import numpy as np
+
+
+class HdrMerge:
+    """Combines frames of the same point taken at several exposures
+
+    Each pixel's count rate is estimated from the brackets where it is not
+    saturated: rate = sum(counts) / sum(exposure), the maximum-likelihood
+    estimate for shot-noise limited counts, so the long exposures dominate
+    at high q and the short ones fill in the saturated central lobe. The
+    merged frame is float32 counts at the reference exposure. A dark frame
+    given to begin() is subtracted from every bracket before it is added,
+    since the camera offset does not scale with the exposure. Saturation is
+    checked on the raw counts, where the ADC clips. Pixels saturated in
+    every bracket get the saturation level of the shortest exposure, a
+    lower bound.
+
+    Args:
+        exposures_ms: exposures of the brackets in ms
+        saturation: raw count at and above which a pixel is treated as saturated
+        reference_ms: exposure the merged counts are scaled to, the longest bracket by default
+    """
+    def __init__(self, exposures_ms, saturation, reference_ms=None):
+        exposures_ms = [float(e) for e in exposures_ms]
+        if len(exposures_ms) < 2:
+            raise ValueError("HDR needs at least two exposures")
+        if min(exposures_ms) <= 0:
+            raise ValueError("HDR exposures must be positive")
+        self.exposures_ms = exposures_ms
+        self.saturation = float(saturation)
+        self.reference_ms = max(exposures_ms) if reference_ms is None else float(reference_ms)
+        self.saturated_pixels = 0  # pixels saturated in every bracket of the last merge
+        self._total = None
+        self._time = None
+        self._valid = None
+        self._dark = None
+
+    def describe(self):
+        return {'exposures_ms': self.exposures_ms, 'saturation': self.saturation,
+                'reference_ms': self.reference_ms}
+
+    def order(self, index):
+        """Bracket order for a point, reversed on alternate points so each starts at the exposure already set"""
+        return self.exposures_ms if index % 2 == 0 else self.exposures_ms[::-1]
+
+    def begin(self, out, dark=None):
+        """Start a merge into the float32 buffer out, subtracting dark from every bracket"""
+        shape = out.shape
+        if self._time is None or self._time.shape != shape:
+            self._time = np.empty(shape, dtype=np.float32)
+            self._valid = np.empty(shape, dtype=bool)
+        self._total = out
+        self._dark = dark
+        self._total.fill(0)
+        self._time.fill(0)
+
+    def add(self, frame, exposure_ms):
+        """Add the unsaturated pixels of one bracket"""
+        np.less(frame, self.saturation, out=self._valid)
+        np.add(self._total, frame, out=self._total, where=self._valid, casting='unsafe')
+        if self._dark is not None:
+            np.subtract(self._total, self._dark, out=self._total, where=self._valid)
+        np.add(self._time, exposure_ms, out=self._time, where=self._valid, casting='unsafe')
+
+    def finish(self):
+        """Merged frame in counts at the reference exposure"""
+        total, exposure = self._total, self._time
+        np.equal(exposure, 0, out=self._valid)
+        self.saturated_pixels = int(np.count_nonzero(self._valid))
+        if self.saturated_pixels:
+            np.copyto(total, self.saturation, where=self._valid)
+            if self._dark is not None:
+                np.subtract(total, self._dark, out=total, where=self._valid)
+            np.copyto(exposure, min(self.exposures_ms), where=self._valid)
+        np.divide(total, exposure, out=total)
+        np.multiply(total, self.reference_ms, out=total)
+        self._total = None
+        self._dark = None
+        return total
@@ -0,0 +1,180 @@
+# mmapwriter.py
+# zero-encode scan output: frames copied into a preallocated memory-mapped .npy stack
+import os
+import datetime
+import json
+import threading
+import time
+import numpy as np
+
+from writer import compression_stats
+
+
+class MemmapWriter:
+    """Copies each frame into its slot of a preallocated (N, H, W) .npy file
+
+    Files, all opened with np.lib.format.open_memmap so readers can
+    np.load(..., mmap_mode='r') them while the scan is still running:
+        <prefix>frames.npy          frames in the camera's native dtype
+        <prefix><column>.npy        float64 array per numeric metadata key, NaN until written
+        <prefix>header.json         scan parameters, shapes and file names
+    """
+    # every frame has its own slot so workers never touch the same memory
+    max_workers = None
+
+    def __init__(self, folder, prefix, overwrite=False, expected_frames=None, resume_from=None):
+        self.parameters = {}
+        self.frames = None
+        self.columns = {}
+        self.count = 0
+        self._lock = threading.Lock()
+        if resume_from:
+            self._open_existing(resume_from)
+            return
+
+        if not expected_frames:
+            raise ValueError("The number of scan points is needed to preallocate the frame stack")
+        self.save_folder = folder
+        self.image_prefix = prefix
+        self.overwrite = overwrite
+        self.num_frames = expected_frames
+        self.header_path = self._path('header.json')
+        if os.path.exists(self.header_path) and not overwrite:
+            timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+            self.image_prefix = f"{prefix}{timestamp}_"
+            self.header_path = self._path('header.json')
+            print(f"Stack already exists. Saving with prefix {self.image_prefix} instead")
+        self.location = self.header_path
+
+    def _open_existing(self, header_path):
+        """Reopen the stack of an interrupted scan to fill in the missing frames"""
+        with open(header_path, 'r') as f:
+            header = json.load(f)
+        self.header_path = header_path
+        self.location = header_path
+        self.save_folder = os.path.dirname(header_path)
+        self.image_prefix = header['prefix']
+        self.num_frames = header['num_frames']
+        if header['frames']:
+            self.frames = np.lib.format.open_memmap(self._path('frames.npy'), mode='r+')
+        for name, filename in header['columns'].items():
+            self.columns[name] = np.lib.format.open_memmap(os.path.join(self.save_folder, filename), mode='r+')
+        self.count = len(self.written_indices())
+        print(f"Resuming stack {self._path('frames.npy')} after {self.count} frames")
+
+    def written_indices(self):
+        """Indices of the slots already filled, the timestamp is written after the frame"""
+        if 'timestamp' not in self.columns:
+            return set()
+        return set(int(i) for i in np.flatnonzero(~np.isnan(self.columns['timestamp'])))
+
+    def write_parameters(self, parameters):
+        """Keep the scan parameters for the JSON header"""
+        self.parameters = parameters
+        self._write_header()
+
+    def write(self, image_data, index, metadata, timings=None):
+        """Copy a frame and its metadata into slot `index`
+
+        Returns:
+            location: 'file:index' of the stored frame or None if saving failed
+        """
+        try:
+            if index >= self.num_frames:
+                print(f"Frame {index} is outside the preallocated stack of {self.num_frames}")
+                return None
+            image_data = np.asarray(image_data)
+            values = {}
+            for key, value in metadata.items():
+                name = self._column_name(key)
+                values[name] = self._to_float(name, value)
+
+            with self._lock:
+                created = self.frames is None
+                if created:
+                    self._create_frames(image_data)
+                new_columns = [name for name, value in values.items()
+                               if value is not None and name not in self.columns]
+                for name in new_columns:
+                    self.columns[name] = self._open_array(name, (self.num_frames,), np.float64, np.nan)
+                if created or new_columns:
+                    # Readers of a running scan find the arrays through the header
+                    self._write_header()
+                self.count += 1
+
+            start = time.perf_counter()
+            self.frames[index] = image_data
+            written_at = time.perf_counter()
+            for name, value in values.items():
+                if value is not None:
+                    self.columns[name][index] = value
+            if timings is not None:
+                timings.add('write', written_at - start)
+                timings.add('metadata', time.perf_counter() - written_at)
+            return f"{self.frames.filename}:{index}"
+
+        except Exception as e:
+            print(f"Error saving image: {e}")
+            return None
+
+    def compression_stats(self):
+        """Frames are stored raw, the ratio is always 1"""
+        raw_bytes = 0 if self.frames is None else self.count * self.frames[0].nbytes
+        return compression_stats({'format': 'npy', 'compression': 'none', 'level': None},
+                                 self.count, raw_bytes, raw_bytes)
+
+    def close(self):
+        """Flush the memory maps to disk and finalise the header"""
+        for array in [self.frames] + list(self.columns.values()):
+            if array is not None:
+                array.flush()
+        self._write_header()
+        print(f"Saved {self.count} frames to {self._path('frames.npy')}")
+
+    def _create_frames(self, image_data):
+        self.frames = self._open_array('frames', (self.num_frames,) + image_data.shape, image_data.dtype)
+
+    def _open_array(self, name, shape, dtype, fill=None):
+        array = np.lib.format.open_memmap(self._path(f'{name}.npy'), mode='w+', dtype=dtype, shape=shape)
+        if fill is not None:
+            array[:] = fill
+        return array
+
+    def _write_header(self):
+        header = {
+            'prefix': self.image_prefix,
+            'parameters': self.parameters,
+            'num_frames': self.num_frames,
+            'frames_written': self.count,
+            'frames': None,
+            'columns': {name: os.path.basename(array.filename) for name, array in self.columns.items()},
+        }
+        if self.frames is not None:
+            header['frames'] = {
+                'file': os.path.basename(self.frames.filename),
+                'shape': list(self.frames.shape),
+                'dtype': self.frames.dtype.str,
+            }
+        try:
+            with open(self.header_path, 'w') as f:
+                json.dump(header, f, indent=4)
+        except (IOError, TypeError) as e:
+            print(f"Error saving stack header: {e}")
+
+    def _path(self, name):
+        return os.path.join(self.save_folder, f"{self.image_prefix}{name}")
+
+    @staticmethod
+    def _to_float(name, value):
+        """Numeric value of a metadata entry, timestamps become seconds since the epoch"""
+        if isinstance(value, bool):
+            return float(value)
+        if isinstance(value, (int, float, np.integer, np.floating)):
+            return float(value)
+        if name == 'timestamp' and isinstance(value, str):
+            return datetime.datetime.fromisoformat(value).timestamp()
+        return None
+
+    @staticmethod
+    def _column_name(key):
+        return key.strip().lower().replace(' ', '_')
@@ -0,0 +1,63 @@
+# motion.py
+# helpers for driving several stages at once and waiting for them to stop
+import time
+
+# Adaptive polling starts fast so short moves are not rounded up, then backs
+# off so long moves do not flood the controller with status requests
+POLL_MIN_INTERVAL = 0.002  # seconds
+POLL_MAX_INTERVAL = 0.05  # seconds
+POLL_BACKOFF = 1.5
+MOVE_TIMEOUT = 60.0  # seconds
+
+
+def wait_for_motion(is_moving, wait=None, timeout=MOVE_TIMEOUT):
+    """Block until a stage has stopped
+
+    Args:
+        is_moving: callable returning True while the stage is moving
+        wait: optional blocking driver primitive that returns once the stage
+            has stopped, tried first and replaced by polling if it fails
+        timeout: give up polling after this many seconds
+
+    Returns:
+        elapsed: time spent waiting in seconds
+    """
+    start = time.monotonic()
+    if wait is not None:
+        try:
+            wait()
+            return time.monotonic() - start
+        except Exception as e:
+            print(f"Blocking wait failed ({e}), polling instead")
+
+    interval = POLL_MIN_INTERVAL
+    while is_moving():
+        if time.monotonic() - start > timeout:
+            print(f"WARNING: stage still moving after {timeout}s, giving up waiting")
+            break
+        time.sleep(interval)
+        interval = min(interval * POLL_BACKOFF, POLL_MAX_INTERVAL)
+    return time.monotonic() - start
+
+
+def move_axes(moves):
+    """Command several stages at the same time and wait for all of them to stop
+
+    The moves are all issued before any wait starts, so the total time is that
+    of the slowest axis rather than the sum of the individual moves.
+
+    Args:
+        moves: iterable of (stage, target_position) pairs, stages may be None
+
+    Returns:
+        positions: list of final positions, one per stage that was moved
+    """
+    started = []
+    for stage, target in moves:
+        if stage is None:
+            continue
+        if stage.start_move_to(target) is False:
+            continue
+        started.append(stage)
+
+    return [stage.wait_for_move() for stage in started]
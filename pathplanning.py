@@ -0,0 +1,113 @@
+# pathplanning.py
+# ordering of arbitrary scan points to minimise stage travel time
+import time
+import numpy as np
+
+
+class AxisProfile:
+    """Trapezoidal motion model of one stage axis
+
+    Args:
+        velocity: maximum velocity in stage units per second
+        acceleration: acceleration (and deceleration) in stage units per second squared
+        overhead: fixed time per move in seconds (command latency, settling)
+    """
+    def __init__(self, velocity=1.0, acceleration=1.0, overhead=0.0):
+        self.velocity = velocity
+        self.acceleration = acceleration
+        self.overhead = overhead
+
+    def move_time(self, distance):
+        """Time to travel the given distance(s), works on scalars and numpy arrays"""
+        distance = np.abs(distance)
+        v, a = self.velocity, self.acceleration
+        # distance needed to reach full speed and stop again
+        ramp = v * v / a
+        triangular = 2.0 * np.sqrt(distance / a)
+        trapezoidal = distance / v + v / a
+        t = np.where(distance < ramp, triangular, trapezoidal)
+        return np.where(distance > 0, t + self.overhead, 0.0)
+
+    def to_dict(self):
+        return {'velocity': self.velocity, 'acceleration': self.acceleration, 'overhead': self.overhead}
+
+
+def move_costs(origin, points, x_profile, y_profile, move_overhead=0.0):
+    """Time to move from origin to each of points with both axes moving together"""
+    d = np.asarray(points, dtype=float) - np.asarray(origin, dtype=float)
+    t = np.maximum(x_profile.move_time(d[..., 0]), y_profile.move_time(d[..., 1]))
+    return t + np.where(np.any(d != 0, axis=-1), move_overhead, 0.0)
+
+
+def path_time(points, x_profile, y_profile, move_overhead=0.0, start=(0.0, 0.0)):
+    """Total move time to visit the points in the given order from start"""
+    points = np.asarray(points, dtype=float)
+    if len(points) == 0:
+        return 0.0
+    path = np.vstack([start, points])
+    return float(np.sum(move_costs(path[:-1], path[1:], x_profile, y_profile, move_overhead)))
+
+
+def order_points(points, x_profile=None, y_profile=None, move_overhead=0.0, start=(0.0, 0.0),
+                 max_passes=10, time_limit=30.0):
+    """Reorder scan points to reduce total move time
+
+    A nearest-neighbour tour from start is improved by 2-opt segment
+    reversals until no reversal helps, max_passes is reached or time_limit
+    seconds have passed.
+
+    Args:
+        points: (N, 2) array of x, y positions
+        x_profile, y_profile: AxisProfile of each stage, unit speed if None
+        move_overhead: fixed time added to every move in seconds
+        start: position the stages are at before the first point
+
+    Returns:
+        order: index array such that points[order] is the optimised path
+    """
+    x_profile = x_profile or AxisProfile()
+    y_profile = y_profile or AxisProfile()
+    points = np.asarray(points, dtype=float)
+    n = len(points)
+    if n < 3:
+        return np.arange(n)
+
+    def cost(a, b):
+        return move_costs(a, b, x_profile, y_profile, move_overhead)
+
+    # Nearest neighbour construction
+    order = np.empty(n, dtype=int)
+    visited = np.zeros(n, dtype=bool)
+    current = np.asarray(start, dtype=float)
+    for k in range(n):
+        c = cost(current, points)
+        c[visited] = np.inf
+        nxt = int(np.argmin(c))
+        order[k] = nxt
+        visited[nxt] = True
+        current = points[nxt]
+
+    # 2-opt on the open path, node 0 of `path` is the fixed start position
+    deadline = time.monotonic() + time_limit
+    path = np.vstack([start, points[order]])
+    idx = np.concatenate([[-1], order])
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1, n):
+            # reverse path[i:j+1] for every j > i at once
+            j = np.arange(i + 1, n + 1)
+            removed = cost(path[i - 1], path[i]) + np.append(cost(path[j[:-1]], path[j[:-1] + 1]), 0.0)
+            added = cost(path[i - 1], path[j]) + np.append(cost(path[i], path[j[:-1] + 1]), 0.0)
+            gain = removed - added
+            best = int(np.argmax(gain))
+            if gain[best] > 1e-12:
+                jb = j[best]
+                path[i:jb + 1] = path[i:jb + 1][::-1].copy()
+                idx[i:jb + 1] = idx[i:jb + 1][::-1].copy()
+                improved = True
+            if time.monotonic() > deadline:
+                break
+        if not improved or time.monotonic() > deadline:
+            break
+
+    return idx[1:]
@@ -0,0 +1,71 @@
+# preview.py
+# latest-frame channel between acquisition and the GUI, and the numpy reduction used to display frames
+import threading
+import numpy as np
+
+
+class LatestFrame:
+    """Single-slot channel holding only the newest published frame
+
+    publish() never blocks and never copies, so the acquisition thread pays
+    nothing for the preview. Readers ask for anything newer than the sequence
+    number they last saw; frames published in between are simply dropped.
+    The frame is shared, not copied, so publishers that reuse their buffers
+    should publish a downsample() copy and readers should reduce it straight
+    away.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._frame = None
+        self._info = {}
+        self._sequence = 0
+
+    def publish(self, frame, **info):
+        """Make frame the latest one, info is shown with it (index, position...)"""
+        with self._lock:
+            self._frame = frame
+            self._info = info
+            self._sequence += 1
+
+    def latest(self, since=0):
+        """(sequence, frame, info) of the newest frame if newer than since, else None"""
+        with self._lock:
+            if self._sequence <= since or self._frame is None:
+                return None
+            return self._sequence, self._frame, self._info
+
+
+def _step(shape, max_width, max_height):
+    return max(1, int(np.ceil(max(shape[0] / max_height, shape[1] / max_width))))
+
+
+def downsample(frame, max_width=640, max_height=480):
+    """Strided copy of a frame that fits in max_width x max_height, safe to publish from a reused buffer"""
+    step = _step(frame.shape, max_width, max_height)
+    return np.array(frame[::step, ::step])
+
+
+def preview_image(frame, max_width=640, max_height=480, log_scale=True):
+    """Reduce a frame to a uint8 image that fits in max_width x max_height
+
+    Downsamples by striding (no copy until the scaling), optionally log-scales
+    so weak diffraction rings stay visible next to the central peak, and
+    stretches the result to the full 8-bit range.
+    """
+    frame = np.asarray(frame)
+    if frame.ndim == 3:
+        # Colour frames from the dummy camera
+        frame = frame.mean(axis=2)
+    step = _step(frame.shape, max_width, max_height)
+    image = frame[::step, ::step].astype(np.float32)
+    if log_scale:
+        np.maximum(image, 0, out=image)
+        np.log1p(image, out=image)
+    low = float(image.min())
+    high = float(image.max())
+    if high > low:
+        image -= low
+        image *= 255.0 / (high - low)
+    else:
+        image[:] = 0
+    return image.astype(np.uint8)
@@ -0,0 +1,118 @@
+# refinement.py
+# adaptive scans: per-frame metrics computed during the scan and the extra points they call for
+import numpy as np
+
+
+class FrameMetric:
+    """Cheap scalar summary of a diffraction frame
+
+    Args:
+        kind: "total" for the summed counts, "high_q" for the counts outside
+            q_fraction of the largest radius from the frame centre
+        q_fraction: inner radius of the high-q region as a fraction of the corner distance
+    """
+    KINDS = ('total', 'high_q')
+
+    def __init__(self, kind='total', q_fraction=0.5):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown metric '{kind}', expected one of {self.KINDS}")
+        self.kind = kind
+        self.q_fraction = q_fraction
+        self._mask = None
+
+    def __call__(self, frame):
+        frame = np.asarray(frame)
+        if frame.ndim == 3:
+            # Colour frames from the dummy camera
+            frame = frame[..., 0]
+        if self.kind == 'total':
+            return float(frame.sum(dtype=np.float64))
+        if self._mask is None or self._mask.shape != frame.shape:
+            height, width = frame.shape
+            y, x = np.ogrid[:height, :width]
+            r = np.hypot(x - (width - 1) / 2, y - (height - 1) / 2)
+            self._mask = r > self.q_fraction * r.max()
+        return float(frame.sum(where=self._mask, dtype=np.float64))
+
+    def describe(self):
+        return {'kind': self.kind, 'q_fraction': self.q_fraction}
+
+
+class Refinement:
+    """Chooses extra scan points where the metric changes between neighbours
+
+    After the coarse pattern, every pair of neighbouring points (closest
+    points along x or y, at most `spacing` apart) whose metrics differ by
+    more than `threshold` times the metric range of the coarse pass gets a
+    point at its midpoint, largest differences first. Each further level
+    halves the spacing and looks at the pairs formed by the new points,
+    until `levels` passes are done or `budget` extra points are used.
+
+    Args:
+        metric: FrameMetric computed on every frame
+        threshold: difference between neighbours, as a fraction of the coarse metric range, that triggers a point
+        budget: maximum number of extra points, None for as many as the coarse pass
+        levels: maximum number of refinement passes
+    """
+    def __init__(self, metric=None, threshold=0.2, budget=None, levels=2):
+        self.metric = metric or FrameMetric()
+        self.threshold = threshold
+        self.budget = budget
+        self.levels = levels
+        self.scale = None  # metric range of the coarse pass
+
+    def describe(self):
+        return {'metric': self.metric.describe(), 'threshold': self.threshold, 'budget': self.budget,
+                'levels': self.levels}
+
+    def new_points(self, points, values, spacing, budget):
+        """Midpoints of neighbouring pairs that differ too much
+
+        Args:
+            points: (N, 2) array of measured x, y offsets
+            values: (N,) metric of each point
+            spacing: largest x or y distance between points treated as neighbours
+            budget: maximum number of points to return
+
+        Returns:
+            (M, 2) array of new offsets, largest metric difference first
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        values = np.asarray(values, dtype=float)
+        if self.scale is None:
+            self.scale = float(values.max() - values.min()) if values.size else 0.0
+        if budget <= 0 or self.scale <= 0 or len(points) < 2:
+            return np.zeros((0, 2))
+
+        tolerance = 1e-6 * spacing
+        pairs = self._neighbour_pairs(points, spacing, tolerance)
+        i, j = pairs[:, 0], pairs[:, 1]
+        difference = np.abs(values[i] - values[j])
+        selected = difference > self.threshold * self.scale
+        order = np.argsort(-difference[selected], kind='stable')
+        candidates = ((points[i] + points[j]) / 2)[selected][order]
+
+        # Drop repeats and points already measured
+        seen = {tuple(key) for key in np.round(points / tolerance).astype(np.int64)}
+        new = []
+        for point in candidates:
+            key = tuple(np.round(point / tolerance).astype(np.int64))
+            if key in seen:
+                continue
+            seen.add(key)
+            new.append(point)
+            if len(new) >= budget:
+                break
+        return np.array(new, dtype=float).reshape(-1, 2)
+
+    @staticmethod
+    def _neighbour_pairs(points, spacing, tolerance):
+        """(P, 2) indices of consecutive points along each row and each column, at most spacing apart"""
+        pairs = []
+        for along, across in ((0, 1), (1, 0)):
+            line = np.round(points[:, across] / tolerance).astype(np.int64)
+            order = np.lexsort((points[:, along], line))
+            gap = np.diff(points[order, along])
+            neighbours = (line[order][1:] == line[order][:-1]) & (gap > tolerance) & (gap <= spacing + tolerance)
+            pairs.append(np.stack([order[:-1][neighbours], order[1:][neighbours]], axis=1))
+        return np.concatenate(pairs)
@@ -1,13 +1,32 @@
 from stage import Stage
 from camera import Camera
+from simulation import SimStage, SimCamera
+from motion import move_axes, POLL_MAX_INTERVAL
+from writer import FileWriter, WriterPipeline
+from framecodecs import FrameCodec
+from calibration import FrameCorrection
+from hdr import HdrMerge
+from h5writer import Hdf5Writer
+from mmapwriter import MemmapWriter
+from settle import SettlePolicy
+from pathplanning import order_points, path_time
+from refinement import FrameMetric, Refinement
+from checkpoint import ScanCheckpoint
+from timing import PhaseTimer
+from scantrace import ScanTrace
+from preview import LatestFrame, downsample
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import time
 import os
 import datetime
-import cv2
 
 class Scan:
-    def __init__(self, cam, x, y):
+    def __init__(self, cam, x, y, cameras=None):
         self.camera = cam
+        # Additional named cameras triggered with the main one at every point, one frame each per point
+        self.cameras = {} if cameras is None else cameras
+        self.camera_frames = {}  # Frames of the additional cameras at the current point
         self.x_stage = x
         self.y_stage = y
         
@@ -17,17 +36,67 @@ class Scan:
         self.res_x = 1.0  # X resolution (step size)
         self.res_y = 1.0  # Y resolution (step size)
         self.snake_pattern = True  # True for snake, False for ladder
+        self.settle = SettlePolicy()  # No extra wait after moves by default
+        self.position_max_age = 0.05  # s a cached stage position may be old to be recorded as measured at a frame
+        self.points = None  # Optional (N, 2) array of x, y offsets from the scan zero used instead of the grid
+        self.plan = None  # ScanPlan of extra axes (z, rotation, energy, exposure...) scanned around the x/y pattern
+        self.axis_values = {}  # Targets of the extra axes at the current point
+        self._targets = {}  # Last target commanded to each device during this scan, to skip unchanged axes
+        self._axis_start = {}  # Positions of the extra axes' devices before the scan
+        self.refinement = None  # Refinement adding points where the frame metric changes, None for a fixed pattern
+        self.refinement_spacing = None  # Neighbour distance of the coarse pattern, the grid step by default
+        self.refined_points = np.zeros((0, 2))  # x, y offsets added by refinement, scanned after the pattern
+        self.metrics = {}  # Frame metric of each point index while refining
+        self.path_optimized = False
+        
+        # Fly scan: rows are continuous constant-velocity moves on X with frames taken on the fly
+        self.fly_scan = False
+        self.fly_velocity = None  # X velocity during rows, None to cover one step per frame period
+        self.fly_trigger = "time"  # "time" for computed frame times, "position" to trigger on the measured position
+        self.fly_dead_time = 0.05  # s between frames beyond the exposure (readout, transfer), sets the default velocity
+        self.fly_margin = 0.05  # s of constant velocity before the first frame of a row
+        self.fly_timeout = 5.0  # s to wait for the stage to reach a trigger position
+        self.fly_poll_min = 0.0005  # s, shortest gap between position reads while waiting for a trigger
+        
+        # Several exposures per point summed (or averaged) into one frame
+        self.frames_per_point = 1
+        self.accumulation = "sum"  # "sum" into uint32 (float32 for float frames) or "mean" into float32
+        self.save_subframes = False  # Also save every exposure to <prefix>sub_ outputs
+        self.hdr = None  # HdrMerge of exposure brackets taken at every point, None for a single exposure
+        self.save_brackets = False  # Also save the raw brackets to <prefix>sub_ outputs
+        self.correction = None  # FrameCorrection applied to every frame before it is saved
+        self._correction_checked = False
+        self._buffers = {}  # Preallocated frame buffers by (shape, dtype), reused in turn to cover the writer queue
         
         # Image saving parameters
         self.save_folder = os.path.expanduser("~/scan_images")  # Default folder
         self.image_prefix = "scan_"  # Default prefix
         self.auto_save = True  # Auto-save by default
         self.overwrite = False  # Don't overwrite by default
+        self.output_format = "png"  # "png", "tiff" or "blosc" for a file + .txt per point, "hdf5" for a single file, "npy" for a raw memory-mapped stack
+        self.compression = None  # Compression within the format (see FrameCodec and Hdf5Writer), None for its default
+        self.compression_level = None  # None for the default level of the compression
+        self.compression_report = None  # Compression ratio and encode times of the last scan
+        self.writer_threads = min(4, os.cpu_count() or 2)  # Worker threads encoding and saving frames
+        self.writer_queue_size = 8  # Frames that may wait to be saved before the scan blocks
+        self.writer = None
+        self.subframe_writer = None  # Pipeline saving individual exposures when save_subframes is set
+        self.camera_writers = {}  # Pipeline per additional camera saving to <prefix><name>_ outputs
+        self._camera_pool = None  # Threads snapping the additional cameras while the main camera exposes
+        self.timings = PhaseTimer()  # Per-phase wall times of the last scan
+        self.trace = ScanTrace()  # Timestamped events of each point, subscribe to follow a running scan
+        self.preview = LatestFrame()  # Latest frame of the running scan for live display
+        self.trace_to_file = True  # Also write the trace to <prefix>trace<suffix>.jsonl beside the saved data
+        self.output_suffix = ''  # Added to the file names of a scan whose folder already holds files with its prefix
+        self.checkpoint = None  # Progress record of the running scan
+        self.resume_checkpoint = None  # Checkpoint loaded by load_checkpoint, continued by start_scan(resume=True)
         
         # State variables
         self.is_running = False
         self.is_paused = False
         self.current_image = 0
+        self.scan_zero = (0.0, 0.0)
+        self.scan_error = None  # Error that stopped the last scan, None if it ran to the end or was cancelled
         
     def setup_scan(self, num_x, num_y, res_x, res_y, snake_pattern=True):
         """Configure the scan parameters"""
@@ -39,13 +108,218 @@ class Scan:
         print(f"Scan configured: {num_x}x{num_y} grid with {res_x}x{res_y} resolution")
         print(f"Pattern: {'Snake' if snake_pattern else 'Ladder'}")
     
-    def setup_saving(self, folder, prefix, auto_save=True, overwrite=False):
+    def setup_points(self, points, optimize=True, move_overhead=0.0):
+        """Scan an arbitrary list of (x, y) offsets from the scan start instead of the grid
+
+        Args:
+            points: sequence of (x, y) offsets in stage units
+            optimize: reorder the points to minimise the total move time
+            move_overhead: fixed time per move in seconds used by the optimiser
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        self.path_optimized = optimize
+        if optimize:
+            x_profile = self.x_stage.get_motion_profile() if self.x_stage else None
+            y_profile = self.y_stage.get_motion_profile() if self.y_stage else None
+            before = path_time(points, x_profile, y_profile, move_overhead)
+            points = points[order_points(points, x_profile, y_profile, move_overhead)]
+            after = path_time(points, x_profile, y_profile, move_overhead)
+            print(f"Path optimised: estimated move time {before:.1f}s -> {after:.1f}s")
+        self.points = points
+        print(f"Scan configured: {len(points)} points from list")
+
+    def clear_points(self):
+        """Go back to scanning the rectangular grid"""
+        self.points = None
+        self.path_optimized = False
+
+    def setup_refinement(self, metric="total", threshold=0.2, budget=None, levels=2, q_fraction=0.5, spacing=None):
+        """Add points where the frame metric of neighbouring points differs after the coarse pattern
+
+        Args:
+            metric: "total" counts or "high_q" counts per frame, None to disable refinement
+            threshold: neighbour difference as a fraction of the coarse metric range that adds a point
+            budget: maximum number of added points, None for as many as the coarse pattern
+            levels: maximum number of refinement passes, each halving the spacing
+            q_fraction: inner radius of the high-q region as a fraction of the frame corner distance
+            spacing: neighbour distance of a point list, the grid step is used for grids
+        """
+        if metric is None:
+            self.refinement = None
+            print("Refinement: Disabled")
+            return
+        self.refinement = Refinement(FrameMetric(metric, q_fraction), threshold, budget, levels)
+        self.refinement_spacing = spacing
+        print(f"Refinement: {metric} metric, threshold {threshold}, budget {budget or 'pattern size'}, "
+              f"{levels} levels")
+
+    def expected_frames(self):
+        """Largest number of points the scan can take, including the refinement budget"""
+        if self.refinement is None:
+            return self.num_points
+        return self.num_points + self._refinement_budget()
+
+    def _refinement_budget(self):
+        return self.num_points if self.refinement.budget is None else self.refinement.budget
+
+    def setup_axes(self, plan):
+        """Scan the x/y pattern at every point of a ScanPlan of extra axes, None for a plain x/y scan"""
+        self.plan = plan if plan is not None and plan.axes else None
+        if self.plan:
+            print(f"Scan axes: {self.plan.names} ({len(self.plan)} points) around the x/y pattern, "
+                  f"{self.num_points} points in total")
+
+    def clear_axes(self):
+        self.plan = None
+
+    def get_scan_points(self):
+        """(N, 2 + axes) array of the x, y offsets and extra axis targets of every point in acquisition order"""
+        points = self.get_points()
+        if self.plan is None:
+            return np.vstack([points, self.refined_points]) if len(self.refined_points) else points
+        outer = self.plan.points()
+        return np.hstack([np.tile(points, (len(outer), 1)), np.repeat(outer, len(points), axis=0)])
+
+    def get_points(self):
+        """(N, 2) array of x, y offsets from the scan zero in acquisition order"""
+        if self.points is not None:
+            return self.points
+
+        points = []
+        for row in range(self.num_y):
+            columns = range(self.num_x)
+            if self.snake_pattern and row % 2 == 1:
+                columns = reversed(columns)
+            for column in columns:
+                points.append((column * self.res_x, row * self.res_y))
+        return np.array(points, dtype=float).reshape(-1, 2)
+
+    @property
+    def num_points(self):
+        xy_points = len(self.points) if self.points is not None else self.num_x * self.num_y
+        return xy_points * (len(self.plan) if self.plan else 1)
+
+    def setup_settle(self, settle):
+        """Configure the settle policy applied after each move"""
+        self.settle = settle
+        print(f"Settle configuration: {settle.to_dict()}")
+
+    def setup_accumulation(self, frames_per_point=1, mode="sum", save_subframes=False):
+        """Configure the number of exposures summed or averaged at each point
+
+        Args:
+            frames_per_point: exposures taken at each point while the camera stays armed
+            mode: "sum" or "mean"
+            save_subframes: also save the individual exposures
+        """
+        if mode not in ("sum", "mean"):
+            raise ValueError(f"Unknown accumulation mode '{mode}'")
+        self.frames_per_point = max(1, int(frames_per_point))
+        self.accumulation = mode
+        self.save_subframes = save_subframes
+        print(f"Accumulation: {self.frames_per_point} frames per point ({mode}), "
+              f"sub-frames {'saved' if save_subframes else 'not saved'}")
+
+    def setup_hdr(self, exposures_ms=None, saturation=None, save_brackets=False, reference_ms=None):
+        """Take a bracket of exposures at each point and save their high-dynamic-range merge
+
+        Args:
+            exposures_ms: exposures in ms, None or fewer than two to disable bracketing
+            saturation: raw count treated as saturated, the camera's maximum count by default
+            save_brackets: also save the raw bracket frames
+            reference_ms: exposure the merged counts are scaled to, the longest bracket by default
+        """
+        if not exposures_ms or len(exposures_ms) < 2:
+            self.hdr = None
+            self.save_brackets = False
+            print("HDR: Disabled")
+            return
+        if saturation is None:
+            saturation = self.camera.get_saturation_level()
+            if saturation is None:
+                raise ValueError("Camera saturation level unknown, pass saturation explicitly")
+        self.hdr = HdrMerge(exposures_ms, saturation, reference_ms)
+        self.save_brackets = save_brackets
+        print(f"HDR: exposures {self.hdr.exposures_ms} ms, saturation {self.hdr.saturation}, "
+              f"brackets {'saved' if save_brackets else 'not saved'}")
+
+    def setup_fly_scan(self, enabled=True, velocity=None, trigger="time", dead_time=None):
+        """Configure fly scanning of grid rows
+
+        Args:
+            enabled: fly scan rows instead of stopping at every point
+            velocity: X velocity during rows in stage units/s, None to move one step per frame period
+            trigger: "time" to take frames at the computed crossing times, "position" to wait for the
+                measured stage position to reach each point
+            dead_time: time per frame beyond the exposure in seconds
+        """
+        if trigger not in ("time", "position"):
+            raise ValueError(f"Unknown fly scan trigger '{trigger}'")
+        self.fly_scan = enabled
+        self.fly_velocity = velocity
+        self.fly_trigger = trigger
+        if dead_time is not None:
+            self.fly_dead_time = dead_time
+        print(f"Fly scan: {'Enabled' if enabled else 'Disabled'}, velocity: {velocity}, trigger: {trigger}")
+
+    def get_fly_velocity(self):
+        """X velocity used for fly scan rows"""
+        if self.fly_velocity:
+            return self.fly_velocity
+        return abs(self.res_x) / (self.camera.exposure / 1000.0 + self.fly_dead_time)
+
+    def get_scan_parameters(self):
+        """Scan configuration stored alongside the saved images"""
+        return {
+            'num_x': self.num_x,
+            'num_y': self.num_y,
+            'res_x': self.res_x,
+            'res_y': self.res_y,
+            'snake_pattern': self.snake_pattern,
+            'scan_mode': 'grid' if self.points is None else 'points',
+            'num_points': self.num_points,
+            'path_optimized': self.path_optimized,
+            'axes': self.plan.describe() if self.plan else None,
+            'refinement': self.refinement.describe() if self.refinement else None,
+            'scan_zero': list(self.scan_zero),
+            'exposure_ms': self.camera.exposure if self.camera else None,
+            'camera_roi': self.camera.get_roi() if self.camera else None,
+            'cameras': {name: {'exposure_ms': camera.exposure, 'roi': camera.get_roi()}
+                        for name, camera in self.cameras.items()},
+            'settle': self.settle.to_dict(),
+            'correction': self.correction.describe() if self.correction else None,
+            'frames_per_point': self.frames_per_point,
+            'accumulation': self.accumulation,
+            'save_subframes': self.save_subframes,
+            'hdr': self.hdr.describe() if self.hdr else None,
+            'save_brackets': self.save_brackets,
+            'fly_scan': {'velocity': self.get_fly_velocity(), 'trigger': self.fly_trigger,
+                         'dead_time': self.fly_dead_time, 'margin': self.fly_margin} if self.fly_scan else None,
+            'save_folder': self.save_folder,
+            'image_prefix': self.image_prefix,
+            'output_format': self.output_format,
+            'compression': self.compression,
+            'compression_level': self.compression_level,
+            'started': datetime.datetime.now().isoformat(),
+        }
+
+    def setup_saving(self, folder, prefix, auto_save=True, overwrite=False, output_format="png", compression=None,
+                     compression_level=None):
         """Configure image saving parameters"""
+        if output_format in FrameCodec.COMPRESSIONS:
+            try:
+                FrameCodec(output_format, compression, compression_level)
+            except (ValueError, ImportError) as e:
+                print(f"Error in compression settings: {e}")
+                return False
         # Use the folder provided rather than defaulting to ~/scan_images
         self.save_folder = folder
         self.image_prefix = prefix
         self.auto_save = auto_save
         self.overwrite = overwrite
+        self.output_format = output_format
+        self.compression = compression
+        self.compression_level = compression_level
         
         # Ensure the save folder exists
         if not os.path.exists(self.save_folder) and self.auto_save:
@@ -58,16 +332,125 @@ class Scan:
                 
         print(f"Save configuration: Folder='{folder}', Prefix='{prefix}'")
         print(f"Auto-save: {'Enabled' if auto_save else 'Disabled'}, Overwrite: {'Enabled' if overwrite else 'Disabled'}")
+        print(f"Output format: {output_format}, Compression: {compression or 'default'}, Level: {compression_level or 'default'}")
         return True
-    def start_scan(self):
-        """Start or resume a scan"""
+    def load_checkpoint(self, path):
+        """Restore the settings of an interrupted scan so that start_scan(resume=True) continues it
+
+        Returns:
+            first_missing: index of the first point still to be acquired, None if the scan is complete
+        """
+        checkpoint = ScanCheckpoint.load(path)
+        parameters = checkpoint.parameters
+        output = checkpoint.output
+
+        self.setup_scan(parameters['num_x'], parameters['num_y'], parameters['res_x'], parameters['res_y'],
+                        parameters['snake_pattern'])
+        self.setup_settle(SettlePolicy(**parameters['settle']))
+        if parameters.get('correction'):
+            self.setup_correction(FrameCorrection.load(output['folder'], output['prefix']))
+        else:
+            self.correction = None
+        self.setup_accumulation(parameters.get('frames_per_point', 1), parameters.get('accumulation', 'sum'),
+                                parameters.get('save_subframes', False))
+        hdr = parameters.get('hdr')
+        if hdr:
+            self.setup_hdr(hdr['exposures_ms'], hdr['saturation'], parameters.get('save_brackets', False),
+                           hdr['reference_ms'])
+        else:
+            self.setup_hdr(None)
+        fly = parameters.get('fly_scan')
+        if fly:
+            self.setup_fly_scan(True, fly['velocity'], fly['trigger'], fly['dead_time'])
+            self.fly_margin = fly['margin']
+        else:
+            self.fly_scan = False
+        self.setup_saving(output['folder'], output['prefix'], True, False, output['format'], output['compression'],
+                          output.get('compression_level'))
+        axes = parameters.get('axes')
+        if axes:
+            # Devices cannot be stored, the same axes have to be bound again with setup_axes
+            if self.plan is None or self.plan.names != [axis['name'] for axis in axes['axes']]:
+                raise ValueError(f"Checkpoint scans axes {[axis['name'] for axis in axes['axes']]}, "
+                                 f"bind them with setup_axes before loading it")
+            for axis, saved in zip(self.plan.axes, axes['axes']):
+                if not np.array_equal(axis.positions, saved['positions']):
+                    print(f"WARNING: positions of axis '{axis.name}' differ from the checkpoint, using the checkpoint's")
+                    axis.positions = np.array(saved['positions'], dtype=float)
+                axis.relative = saved['relative']
+                axis.origin = saved['origin']
+        else:
+            self.plan = None
+        # Metrics of the frames already taken are not kept, so only the points chosen so far are finished
+        self.refinement = None
+        self.refined_points = np.zeros((0, 2))
+        if parameters.get('refinement'):
+            print("Refinement is not continued on resume, scanning the recorded coarse and refined points")
+        # Always scan the recorded points so indices match what is already on disk
+        self.clear_points()
+        points = np.array(checkpoint.points, dtype=float).reshape(-1, 2 + (len(self.plan.axes) if self.plan else 0))
+        # The x/y pattern is repeated at every point of the extra axes
+        points = points[:len(points) // (len(self.plan) if self.plan else 1), :2]
+        if parameters['scan_mode'] != 'grid' or not np.array_equal(self.get_points(), points):
+            self.points = points
+            self.path_optimized = parameters['path_optimized']
+        if self.camera and parameters.get('exposure_ms') is not None:
+            self.camera.set_exposure(parameters['exposure_ms'])
+        if self.camera and parameters.get('camera_roi'):
+            self.camera.set_roi(**parameters['camera_roi'])
+        for name, settings in parameters.get('cameras', {}).items():
+            camera = self.cameras.get(name)
+            if camera is None:
+                print(f"WARNING: camera '{name}' of the checkpoint is not connected, its frames will not be taken")
+                continue
+            camera.set_exposure(settings['exposure_ms'])
+            if settings.get('roi'):
+                camera.set_roi(**settings['roi'])
+
+        self.resume_checkpoint = checkpoint
+        first_missing = checkpoint.first_missing()
+        print(f"Loaded checkpoint {path}: {len(checkpoint.completed)} of {len(checkpoint.points)} points recorded as done")
+        return first_missing
+
+    def start_scan(self, resume=False):
+        """Start a scan, or continue the one loaded by load_checkpoint if resume is True"""
         self.is_running = True
         self.is_paused = False
-        print("Scan started")
-        self.scan_zero = (self.x_stage.position,self.y_stage.position)
+        resume_checkpoint = self.resume_checkpoint if resume else None
+        self.resume_checkpoint = None
+        if resume_checkpoint:
+            self.scan_zero = resume_checkpoint.scan_zero
+            print(f"Resuming scan from {resume_checkpoint.path}")
+        else:
+            print("Scan started")
+            self.scan_zero = (self.x_stage.position,self.y_stage.position)
+            if self.plan:
+                for axis in self.plan.axes:
+                    axis.origin = axis.device.position if axis.relative else 0.0
+        self._targets = {}
+        self.axis_values = {}
+        self.metrics = {}
+        if not resume_checkpoint:
+            self.refined_points = np.zeros((0, 2))
+        if self.refinement:
+            self.refinement.scale = None
+        self._axis_start = {axis.name: axis.device.position for axis in self.plan.axes} if self.plan else {}
         print(f"begining a scan from {self.scan_zero}")
+        self.timings.reset()
+        self.trace.clear()
+        self.compression_report = None
+        self.scan_error = None
+        self._correction_checked = False
+        base_exposure = self.camera.exposure
         
         try:
+            if self.hdr and self.frames_per_point > 1:
+                raise ValueError("HDR brackets cannot be combined with several frames per point")
+            if self.hdr and self.fly_scan:
+                raise ValueError("HDR brackets need the stage stopped, disable fly scanning")
+            if self.refinement and self.plan:
+                raise ValueError("Refinement works on x/y scans only, clear the extra axes")
+
             # Check save directory exists if auto-save is enabled
             if self.auto_save and not os.path.exists(self.save_folder):
                 try:
@@ -76,43 +459,290 @@ class Scan:
                 except Exception as e:
                     print(f"Error creating save folder: {e}. Auto-save disabled.")
                     self.auto_save = False
-            
-            for i in range(self.num_x * self.num_y):
-                if not self.is_running:
-                    break
-                    
-                self.current_image = i
-                if self.is_paused:
-                    time.sleep(0.1)  # Small sleep to prevent CPU hogging while paused
-                    continue
-                
-                target_y = self.scan_zero[1] +  (i//self.num_y) * self.res_y
-
-                if self.snake_pattern and (i//self.num_y) % 2 == 1:
-                    target_x = self.scan_zero[0] + (self.num_x - (1 + (i % self.num_x))) * self.res_x
-                else:
-                    target_x = self.scan_zero[0] + (i % self.num_x) * self.res_x
 
-                self.x_stage.move_to(target_x)
-                self.y_stage.move_to(target_y)
+            if self.auto_save:
+                self.output_suffix = self._output_suffix(resume_checkpoint)
+            if self.auto_save and self.trace_to_file:
+                self.trace.open(os.path.join(self.save_folder, f"{self.image_prefix}trace{self.output_suffix}.jsonl"),
+                                append=resume_checkpoint is not None)
 
-                # Take image at current position
-                print(f"Scanning position ({target_x}, {target_y})")
-                image = self.camera.snap_image()
+            done = set()
+            if self.auto_save:
+                done = self._open_writer(resume_checkpoint)
+            elif resume_checkpoint:
+                print("WARNING: auto-save is disabled, resuming from the checkpoint's completed points")
+                done = resume_checkpoint.completed
 
-                # Save image with position information
-                self._save_image(image, i, target_x, target_y)
-
-                # Small delay to avoid overwhelming the hardware
-                time.sleep(1)
+            # Keep the cameras running for the whole scan instead of arming per frame
+            self.camera.arm()
+            for camera in self.cameras.values():
+                camera.arm()
+            if self.cameras:
+                self._camera_pool = ThreadPoolExecutor(max_workers=len(self.cameras), thread_name_prefix='camera')
+            
+            if self.fly_scan and self.points is not None:
+                print("WARNING: fly scans need a grid, scanning the point list step by step")
+            self._scan_axes(done)
                 
             print("Scan completed")
             self.reset_scan()
             
         except Exception as e:
             print(f"Error during scan: {e}")
+            self.scan_error = str(e)
             self.is_running = False
+
+        finally:
+            self.camera.disarm()
+            for camera in self.cameras.values():
+                camera.disarm()
+            if self._camera_pool:
+                self._camera_pool.shutdown()
+                self._camera_pool = None
+            if self.camera.exposure != base_exposure:
+                self.camera.set_exposure(base_exposure)
+            # Make sure every queued frame reaches the disk, even when cancelled
+            self._close_writer()
+            if self.checkpoint:
+                self.checkpoint.finish()
+                self.checkpoint = None
+            self.trace.close()
             
+    def _scan_axes(self, done):
+        """Scan the x/y pattern at each point of the extra axes, moving only the axes whose target changes"""
+        outer = self.plan.points() if self.plan else np.zeros((1, 0))
+        xy_points = len(self.get_points())
+        for k, targets in enumerate(outer):
+            if not self.is_running:
+                break
+            first = k * xy_points
+            if all(i in done for i in range(first, first + xy_points)):
+                continue
+            if self.plan:
+                self.axis_values = dict(zip(self.plan.names, map(float, targets)))
+                moves = self._changed_moves([(axis.device, t) for axis, t in zip(self.plan.axes, targets)])
+                if moves:
+                    self.trace.record('command', first, **self.axis_values)
+                    print(f"Moving scan axes to {self.axis_values}")
+                    with self.timings.time('move_axes'):
+                        move_axes(moves)
+            if self.fly_scan and self.points is None:
+                self._fly_scan(done, first)
+            else:
+                self._step_scan(done, first)
+        if self.refinement and self.is_running:
+            self._refine(done)
+
+    def _refine(self, done):
+        """Scan extra points between neighbours whose metrics differ, one level at a time"""
+        budget = self._refinement_budget()
+        spacing = self.refinement_spacing or max(abs(self.res_x), abs(self.res_y))
+        for level in range(self.refinement.levels):
+            measured = self.get_scan_points()
+            have = [i for i in range(len(measured)) if i in self.metrics]
+            with self.timings.time('refine'):
+                new = self.refinement.new_points(measured[have], [self.metrics[i] for i in have], spacing,
+                                                 budget - len(self.refined_points))
+            if not len(new):
+                break
+            position = (self.x_stage.position - self.scan_zero[0], self.y_stage.position - self.scan_zero[1])
+            new = new[order_points(new, self.x_stage.get_motion_profile(), self.y_stage.get_motion_profile(),
+                                   start=position)]
+            print(f"Refinement level {level + 1}: {len(new)} points added at spacing {spacing / 2}")
+            self.refined_points = np.vstack([self.refined_points, new])
+            if self.checkpoint:
+                self.checkpoint.add_points(new)
+            self._step_scan(done, len(measured), new)
+            spacing /= 2
+            if not self.is_running:
+                break
+
+    def _measured_position(self, stage):
+        """Measured stage position, from the stage's state cache when it is recent enough"""
+        if stage is None:
+            return float('nan')
+        try:
+            if hasattr(stage, 'get_position'):
+                position = stage.get_position(self.position_max_age)
+            else:
+                position = stage.read_position()
+        except Exception as e:
+            print(f"Error reading {stage.name} position: {e}")
+            return float('nan')
+        return float('nan') if position is None else float(position)
+
+    def _changed_moves(self, moves):
+        """The moves whose device was not already sent to that target during this scan"""
+        changed = [(device, target) for device, target in moves
+                   if device is not None and self._targets.get(device) != target]
+        for device, target in changed:
+            self._targets[device] = target
+        return changed
+
+    def _step_scan(self, done, first=0, points=None):
+        """Step-and-shoot: move to each point, settle, then expose
+
+        Args:
+            done: indices already acquired
+            first: index of the first point of the pattern, the pattern is repeated at each extra axis point
+            points: (N, 2) offsets to scan instead of the pattern
+        """
+        previous = (self._targets.get(self.x_stage, self.scan_zero[0]), self._targets.get(self.y_stage, self.scan_zero[1]))
+        points = self.get_points() if points is None else points
+        for i, (offset_x, offset_y) in enumerate(points, start=first):
+            while self.is_paused and self.is_running:
+                time.sleep(0.1)  # Small sleep to prevent CPU hogging while paused
+            if not self.is_running:
+                break
+            if i in done:
+                continue
+                
+            self.current_image = i
+            point_start = time.perf_counter()
+            target_x = self.scan_zero[0] + offset_x
+            target_y = self.scan_zero[1] + offset_y
+
+            # Command the axes that change together and wait for the slower one
+            moves = self._changed_moves([(self.x_stage, target_x), (self.y_stage, target_y)])
+            self.trace.record('command', i, x=float(target_x), y=float(target_y))
+            with self.timings.time('move'):
+                move_axes(moves)
+            self.trace.record('motion_done', i)
+            self._record_move_latency('move_x', self.x_stage)
+            self._record_move_latency('move_y', self.y_stage)
+
+            # Let the stages settle before exposing
+            step = max(abs(target_x - previous[0]), abs(target_y - previous[1]))
+            settle_time = self.settle.wait(moves, step)
+            self.timings.add('settle', settle_time)
+            previous = (target_x, target_y)
+
+            # Where the stages actually are, usually the read that ended the move
+            with self.timings.time('measure'):
+                measured = {"X Target": float(target_x), "Y Target": float(target_y),
+                            "X Measured": self._measured_position(self.x_stage),
+                            "Y Measured": self._measured_position(self.y_stage)}
+
+            # Take image at current position
+            print(f"Scanning position ({target_x}, {target_y})")
+            image, _, _ = self._acquire_point(i, target_x, target_y)
+
+            # Save image with position information
+            with self.timings.time('save_queue'):
+                self._save_image(image, i, target_x, target_y, settle_time, extra=measured)
+            self.timings.add('point', time.perf_counter() - point_start)
+
+    def _fly_scan(self, done, first=0):
+        """Fly scan: each grid row is one constant-velocity move on X with frames taken on the fly"""
+        velocity = self.get_fly_velocity()
+        exposure = self.camera.exposure / 1000.0
+        if abs(self.res_x) / velocity < exposure:
+            print(f"WARNING: at {velocity} units/s the stage moves more than one step during an exposure")
+        print(f"Fly scanning at {velocity} units/s with {self.fly_trigger} triggers, "
+              f"{velocity * exposure} units of motion per exposure")
+
+        x_profile = self.x_stage.get_motion_profile()
+        self.x_stage.set_velocity(velocity)
+        try:
+            points = self.get_points()
+            for row in range(self.num_y):
+                while self.is_paused and self.is_running:
+                    time.sleep(0.1)  # Rows are only paused between moves
+                if not self.is_running:
+                    break
+                start = row * self.num_x
+                indices = range(first + start, first + start + self.num_x)
+                if all(i in done for i in indices):
+                    continue
+                self._fly_row(indices, points[start:start + self.num_x], velocity, done)
+        finally:
+            self.x_stage.set_velocity(x_profile.velocity)
+
+    def _fly_row(self, indices, offsets, velocity, done):
+        """Run up to speed, pass every point of the row at constant velocity and record where each frame was taken"""
+        xs = self.scan_zero[0] + offsets[:, 0]
+        y = self.scan_zero[1] + offsets[0, 1]
+        direction = 1.0 if xs[-1] >= xs[0] else -1.0
+        exposure = self.camera.exposure / 1000.0
+        profile = self.x_stage.get_motion_profile()
+        acceleration = profile.acceleration
+
+        # Start far enough back to be at full speed before the first exposure begins
+        ramp = velocity ** 2 / (2 * acceleration)
+        run_up = ramp + velocity * (self.fly_margin + exposure / 2)
+        start = xs[0] - direction * run_up
+        end = xs[-1] + direction * run_up
+        with self.timings.time('run_up'):
+            moves = self._changed_moves([(self.x_stage, start), (self.y_stage, y)])
+            refused = [(device, target) for device, target in moves if device.start_move_to(target) is False]
+            for device, target in moves:
+                if (device, target) not in refused:
+                    device.wait_for_move()
+            for device, target in refused:
+                self._targets.pop(device, None)
+            if refused:
+                device, target = refused[0]
+                raise ValueError(f"{device.name} stage refused the fly scan run-up move to {target}, "
+                                 f"the row and {run_up} units either side of it must be within its limits")
+
+        # Centre each exposure on its point
+        triggers = xs - direction * velocity * exposure / 2
+        commanded = time.monotonic()
+        if self.x_stage.start_move_to(end) is False:
+            self._targets.pop(self.x_stage, None)
+            raise ValueError(f"{self.x_stage.name} stage refused the fly scan run-out move to {end}, "
+                             f"the row and {run_up} units either side of it must be within its limits")
+        self._targets[self.x_stage] = end
+        # Trapezoidal profile: ramp up, then constant velocity through the row
+        trigger_times = (commanded + profile.overhead + velocity / acceleration
+                         + (np.abs(triggers - start) - ramp) / velocity)
+
+        for k, i in enumerate(indices):
+            if not self.is_running:
+                break
+            if i in done:
+                continue
+            self.current_image = i
+            point_start = time.perf_counter()
+
+            with self.timings.time('fly_wait'):
+                if self.fly_trigger == "position":
+                    deadline = time.monotonic() + self.fly_timeout
+                    remaining = (triggers[k] - self.x_stage.read_position()) * direction
+                    while remaining > 0:
+                        if time.monotonic() > deadline:
+                            print(f"WARNING: X stage did not reach {triggers[k]} for point {i}")
+                            break
+                        # Each read is a controller round trip: sleep for the time left at full speed,
+                        # which the stage cannot beat, so a point takes a few reads instead of a busy loop
+                        time.sleep(min(max(remaining / velocity, self.fly_poll_min), POLL_MAX_INTERVAL))
+                        remaining = (triggers[k] - self.x_stage.read_position()) * direction
+                else:
+                    delay = trigger_times[k] - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+
+            self.trace.record('command', i, x=float(xs[k]), y=float(y))
+            before = (time.monotonic(), self.x_stage.read_position())
+            image, exposure_start, exposure_end = self._acquire_point(i, xs[k], y)
+            after = (time.monotonic(), self.x_stage.read_position())
+
+            # Interpolate the measured positions around the frame to the middle of the exposure
+            middle = (exposure_start + exposure_end) / 2
+            if after[0] > before[0]:
+                x_pos = before[1] + (after[1] - before[1]) * (middle - before[0]) / (after[0] - before[0])
+            else:
+                x_pos = before[1]
+            print(f"Fly frame {i} at ({x_pos}, {y}), target {xs[k]}")
+
+            extra = {"X Target": float(xs[k]), "Y Target": float(y), "X Measured": float(x_pos),
+                     "Y Measured": self._measured_position(self.y_stage), "Fly Velocity": float(velocity)}
+            with self.timings.time('save_queue'):
+                self._save_image(image, i, x_pos, y, extra=extra)
+            self.timings.add('point', time.perf_counter() - point_start)
+
+        self.x_stage.wait_for_move()
+
     def pause_scan(self):
         """Pause the ongoing scan"""
         self.is_paused = True
@@ -131,76 +761,417 @@ class Scan:
         
     def reset_scan(self):
         """Reset scan position to beginning"""
-        if self.x_stage:
-            self.x_stage.move_to(self.scan_zero[0])
-        if self.y_stage:
-            self.y_stage.move_to(self.scan_zero[1])
+        moves = [(self.x_stage, self.scan_zero[0]), (self.y_stage, self.scan_zero[1])]
+        if self.plan:
+            moves += [(axis.device, self._axis_start[axis.name]) for axis in self.plan.axes
+                      if axis.name in self._axis_start]
+        move_axes(moves)
         self.current_image = 0
         self.is_running = False
         self.is_paused = False
             
-    def _save_image(self, image_data, index, x_pos, y_pos):
-        """Save the image with position metadata
+    def _record_move_latency(self, phase, stage):
+        """Add the command-to-completion time of the stage's last move to the timings"""
+        if stage is not None and stage.last_move_latency is not None:
+            self.timings.add(phase, stage.last_move_latency)
+            stage.last_move_latency = None
+
+    def _acquire_point(self, index, x_pos, y_pos):
+        """Take frames_per_point exposures, or the HDR brackets, with the armed camera and combine them
+
+        Returns:
+            image: the frame, the sum/mean of the exposures or the HDR merge
+            exposure_start, exposure_end: monotonic times of the first trigger and the end of the last exposure
+        """
+        # The additional cameras expose on their own threads while the main camera takes its frames
+        pending = {name: self._camera_pool.submit(self._snap_camera, camera)
+                   for name, camera in self.cameras.items()} if self._camera_pool else {}
+        brackets = self.hdr.order(index) if self.hdr else [None] * self.frames_per_point
+        image = None
+        exposure_start = None
+        for k, bracket in enumerate(brackets):
+            if bracket is not None and bracket != self.camera.exposure:
+                # The camera stays armed, only the exposure of the next trigger changes
+                with self.timings.time('set_exposure'):
+                    self.camera.set_exposure(bracket)
+            exposure = self.camera.exposure / 1000.0
+            snap_start = time.perf_counter()
+            requested = time.monotonic()
+            frame = self.camera.snap_image()
+            received = time.monotonic()
+            snap_time = time.perf_counter() - snap_start
+            self.timings.add('exposure', min(exposure, snap_time))
+            self.timings.add('readout', snap_time - min(exposure, snap_time))
+
+            # Use the camera's trigger time when it has one for this frame
+            trigger = getattr(self.camera, 'last_trigger_time', None)
+            if trigger is None or not requested <= trigger <= received:
+                trigger = requested
+            if exposure_start is None:
+                exposure_start = trigger
+            exposure_end = min(trigger + exposure, received)
+
+            if self.hdr:
+                if not isinstance(frame, np.ndarray):
+                    continue
+                if image is None:
+                    image = self._get_buffer(frame.shape, np.float32)
+                    # The camera offset is the same in every bracket, take it off before scaling
+                    dark = self.correction.dark if self.correction is not None else None
+                    if dark is not None and dark.shape != frame.shape:
+                        raise ValueError(f"dark frame is {dark.shape}, frames are {frame.shape}")
+                    self.hdr.begin(image, dark)
+                if self.save_brackets:
+                    self._save_subframe(frame, index, self.hdr.exposures_ms.index(bracket), x_pos, y_pos)
+                with self.timings.time('merge'):
+                    self.hdr.add(frame, bracket)
+                continue
+            if self.frames_per_point == 1:
+                image = frame
+                break
+            if self.save_subframes:
+                self._save_subframe(frame, index, k, x_pos, y_pos)
+            with self.timings.time('accumulate'):
+                image = self._accumulate(image, frame, k)
+
+        if self.hdr and image is not None:
+            with self.timings.time('merge'):
+                image = self.hdr.finish()
+
+        if self.correction is not None and isinstance(image, np.ndarray):
+            if not self._correction_checked:
+                self.correction.check(image.shape, self.get_exposure())
+                self._correction_checked = True
+            with self.timings.time('correct'):
+                # A sum of N exposures holds N times the dark level
+                frames = self.frames_per_point if self.accumulation == "sum" and not self.hdr else 1
+                # Accumulated and merged frames are scan buffers, a single exposure may belong to the camera
+                owned = self.hdr or self.frames_per_point > 1
+                out = image if owned and image.dtype == np.float32 else self._get_buffer(image.shape, np.float32)
+                result = None
+                if self.correction.keep_dtype and np.issubdtype(image.dtype, np.integer):
+                    result = self._get_buffer(image.shape, image.dtype)
+                image = self.correction.apply(image, out=out, frames=frames, subtract_dark=not self.hdr,
+                                              result=result)
+
+        if self.refinement and isinstance(image, np.ndarray):
+            with self.timings.time('metric'):
+                self.metrics[index] = self.refinement.metric(image)
+
+        if isinstance(image, np.ndarray):
+            # The image may be a ring buffer the next points overwrite, publish a copy of its own
+            self.preview.publish(downsample(image), shape=image.shape[:2], index=index, x=float(x_pos),
+                                 y=float(y_pos))
+        self.trace.record('exposure_start', index, t=exposure_start)
+        self.trace.record('exposure_end', index, t=exposure_end)
+        self.trace.record('frame_received', index, t=received)
+
+        self.camera_frames = {}
+        with self.timings.time('camera_wait'):
+            for name, future in pending.items():
+                frame, snap_time, camera_received = future.result()
+                self.camera_frames[name] = frame
+                self.timings.add(f"camera_{name}", snap_time)
+                self.trace.record('frame_received', index, t=camera_received, camera=name)
+        return image, exposure_start, exposure_end
+
+    def _snap_camera(self, camera):
+        """Take one frame with an additional camera, on a camera pool thread"""
+        snap_start = time.perf_counter()
+        frame = camera.snap_image()
+        return frame, time.perf_counter() - snap_start, time.monotonic()
+
+    def _accumulate(self, total, frame, k):
+        """Add exposure k to the running total in place, dividing by the count after the last one for a mean"""
+        if not isinstance(frame, np.ndarray):
+            return frame if total is None else total
+        if k == 0:
+            if self.accumulation == "mean" or np.issubdtype(frame.dtype, np.floating):
+                total = self._get_buffer(frame.shape, np.float32)
+            else:
+                total = self._get_buffer(frame.shape, np.uint32)
+            np.copyto(total, frame, casting='unsafe')
+        else:
+            np.add(total, frame, out=total, casting='unsafe')
+        if k == self.frames_per_point - 1 and self.accumulation == "mean":
+            np.multiply(total, 1.0 / self.frames_per_point, out=total)
+        return total
+
+    def get_exposure(self):
+        """Exposure in ms the saved frames correspond to, the HDR reference when bracketing"""
+        return self.hdr.reference_ms if self.hdr else self.camera.exposure
+
+    def subframes_per_point(self):
+        """Raw frames saved per point beside the combined one, 0 when they are not saved"""
+        if self.hdr:
+            return len(self.hdr.exposures_ms) if self.save_brackets else 0
+        return self.frames_per_point if self.save_subframes and self.frames_per_point > 1 else 0
+
+    def _get_buffer(self, shape, dtype):
+        """Next preallocated frame buffer of this shape and dtype
+
+        A buffer may be handed to the writer with its point, so there is one
+        per frame that can be queued or being written, plus the one being filled.
+        """
+        count = self.writer_queue_size + self.writer_threads + 1
+        key = (tuple(shape), np.dtype(dtype).str)
+        ring = self._buffers.get(key)
+        if ring is None or len(ring[0]) != count:
+            ring = self._buffers[key] = [[np.empty(shape, dtype=dtype) for _ in range(count)], 0]
+        buffers, n = ring
+        ring[1] = (n + 1) % count
+        return buffers[n]
+
+    def setup_correction(self, correction):
+        """Correct every frame with a FrameCorrection before saving, None to save raw frames"""
+        self.correction = correction
+        if correction is not None:
+            print(f"Frame correction: {correction.describe()}")
+
+    def _frame_persisted(self, index):
+        """Called from the writer threads once a frame is on disk"""
+        self.trace.record('frame_persisted', index)
+        if self.checkpoint:
+            self.checkpoint.mark_done(index)
+
+    def _output_suffix(self, resume_checkpoint=None):
+        """File name suffix of the scan, a timestamp when an earlier scan already used the folder and prefix"""
+        if resume_checkpoint:
+            return resume_checkpoint.output.get('suffix', '')
+        if self.overwrite:
+            return ''
+        if any(name.startswith(self.image_prefix) for name in os.listdir(self.save_folder)):
+            suffix = '_' + datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+            print(f"Files with prefix {self.image_prefix} already exist. Saving this scan with suffix {suffix} instead")
+            return suffix
+        return ''
+
+    def _open_writer(self, resume_checkpoint=None):
+        """Start the background pipeline that saves frames during the scan
+
+        Args:
+            resume_checkpoint: checkpoint of an interrupted scan whose output is reopened and appended to
+
+        Returns:
+            done: indices of the points already present in the output
+        """
+        if self.output_format == "png" and (self.frames_per_point > 1 or self.hdr):
+            raise ValueError("PNG only holds 8 and 16-bit frames, save accumulated and HDR frames as TIFF, blosc, HDF5 or NPY")
+        resume_from = resume_checkpoint.output['location'] if resume_checkpoint else None
+        writer = self._create_writer(self.image_prefix, self.expected_frames(), resume_from,
+                                     resume_checkpoint is not None)
+        locations = resume_checkpoint.output.get('camera_locations', {}) if resume_checkpoint else {}
+        camera_writers = {name: self._create_writer(f"{self.image_prefix}{name}_", self.expected_frames(),
+                                                    locations.get(name), resume_checkpoint is not None)
+                          for name in self.cameras}
+
+        done = set()
+        if resume_checkpoint:
+            # Trust what is actually on disk over what the checkpoint recorded
+            done = writer.written_indices()
+            for camera_writer in camera_writers.values():
+                # A point is only done once every camera has its frame
+                done &= camera_writer.written_indices()
+            if done != resume_checkpoint.completed:
+                print(f"Output holds {len(done)} points, checkpoint recorded {len(resume_checkpoint.completed)}")
+            self.checkpoint = resume_checkpoint
+        else:
+            self.checkpoint = ScanCheckpoint(ScanCheckpoint.filename(self.save_folder, self.image_prefix,
+                                                                     self.output_suffix))
+        self.checkpoint.completed = set(done)
+
+        if self.correction is not None:
+            self.correction.save(self.save_folder, self.image_prefix)
+        parameters = self.get_scan_parameters()
+        output = {
+            'folder': self.save_folder,
+            'prefix': self.image_prefix,
+            'format': self.output_format,
+            'compression': self.compression,
+            'compression_level': self.compression_level,
+            'location': writer.location,
+            'suffix': self.output_suffix,
+        }
+        if camera_writers:
+            output['camera_locations'] = {name: w.location for name, w in camera_writers.items()}
+        if self.subframes_per_point():
+            resume_from = resume_checkpoint.output.get('subframe_location') if resume_checkpoint else None
+            subframes = self._create_writer(f"{self.image_prefix}sub_", self.expected_frames() * self.subframes_per_point(),
+                                            resume_from, resume_checkpoint is not None)
+            output['subframe_location'] = subframes.location
+            self.subframe_writer = WriterPipeline(subframes,
+                                                  num_workers=self.writer_threads,
+                                                  max_queued=self.writer_queue_size)
+            subframes.write_parameters(parameters)
+            self.subframe_writer.start()
+        for name, camera_writer in camera_writers.items():
+            self.camera_writers[name] = WriterPipeline(camera_writer,
+                                                       num_workers=self.writer_threads,
+                                                       max_queued=self.writer_queue_size)
+            camera_writer.write_parameters(parameters)
+            self.camera_writers[name].start()
+        self.checkpoint.begin(parameters, self.get_scan_points(), self.scan_zero, output)
+
+        self.writer = WriterPipeline(writer,
+                                     num_workers=self.writer_threads,
+                                     max_queued=self.writer_queue_size,
+                                     on_written=self._frame_persisted,
+                                     timings=self.timings)
+        writer.write_parameters(parameters)
+        self.writer.start()
+        return done
+
+    def _create_writer(self, prefix, expected_frames, resume_from=None, resuming=False):
+        """Writer for the selected output format"""
+        if self.output_format == "hdf5":
+            return Hdf5Writer(self.save_folder, prefix, self.overwrite,
+                              compression=self.compression or 'none',
+                              compression_level=self.compression_level,
+                              expected_frames=expected_frames,
+                              resume_from=resume_from)
+        if self.output_format == "npy":
+            return MemmapWriter(self.save_folder, prefix, self.overwrite,
+                                expected_frames=expected_frames,
+                                resume_from=resume_from)
+        codec = FrameCodec(self.output_format, self.compression, self.compression_level)
+        # Only missing points are taken again, so there is nothing to protect when resuming
+        return FileWriter(self.save_folder, prefix, self.overwrite or resuming, codec=codec, suffix=self.output_suffix)
+
+    def _close_writer(self):
+        """Wait for all queued frames to be written and stop the pipeline"""
+        if self.subframe_writer:
+            self.subframe_writer.close()
+            self.subframe_writer = None
+        for camera_writer in self.camera_writers.values():
+            camera_writer.close()
+        self.camera_writers = {}
+        if self.writer:
+            print("Waiting for queued images to be saved")
+            self.writer.close()
+            self._report_compression(self.writer.writer)
+            self.writer = None
+
+    def _report_compression(self, writer):
+        """Store and print the compression ratio and encode time of the scan"""
+        report = writer.compression_stats()
+        if report is None:
+            return
+        encode = self.timings.summary().get('encode')
+        report['encode_time'] = encode['total'] if encode else 0.0
+        report['encode_time_per_frame'] = encode['mean'] if encode else 0.0
+        self.compression_report = report
+        if report['ratio']:
+            print(f"Compression {report['codec']}: ratio {report['ratio']:.2f} "
+                  f"({report['raw_bytes'] / 1e6:.1f} MB -> {report['stored_bytes'] / 1e6:.1f} MB), "
+                  f"encode {report['encode_time_per_frame'] * 1000:.1f} ms per frame")
+
+    def _save_image(self, image_data, index, x_pos, y_pos, settle_time=0.0, extra=None):
+        """Queue the image and its position metadata for saving
         
         Args:
             image_data: OpenCV (cv2) image data
             index: Image sequence number
             x_pos: X-axis position when image was taken
             y_pos: Y-axis position when image was taken
+            settle_time: Time spent settling before the exposure in seconds
+            extra: Additional metadata entries
         
         Returns:
-            filepath: Path to saved image or None if saving failed
+            queued: True if the image was handed to the writer
         """
-        if not self.auto_save:
+        if not self.auto_save or self.writer is None:
             print(f"Image at position ({x_pos}, {y_pos}) not saved (auto-save disabled)")
-            return None
-            
-        try:
-            # Create filename with index
-            filename = f"{self.image_prefix}{index:04d}.png"
-            filepath = os.path.join(self.save_folder, filename)
-            
-            # Check if file exists and handle accordingly
-            if os.path.exists(filepath) and not self.overwrite:
-                timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
-                filename = f"{self.image_prefix}{index:04d}_{timestamp}.png"
-                filepath = os.path.join(self.save_folder, filename)
-                print(f"File already exists. Saving as {filename} instead")
-            
-            # Save the OpenCV image
-            success = cv2.imwrite(filepath, image_data)
-            
-            if not success:
-                print(f"Failed to save image to {filepath}")
-                return None
-                
-            print(f"Saved image to {filepath}")
-            
-            # Add position metadata to a companion file
-            metadata_path = filepath.replace('.png', '.txt')
-            with open(metadata_path, 'w') as f:
-                f.write(f"X Position: {x_pos}\n")
-                f.write(f"Y Position: {y_pos}\n")
-                f.write(f"Index: {index}\n")
-                f.write(f"Timestamp: {datetime.datetime.now().isoformat()}\n")
-                
-            return filepath
-            
-        except Exception as e:
-            print(f"Error saving image: {e}")
-            return None
+            return False
+
+        metadata = {
+            "X Position": float(x_pos),
+            "Y Position": float(y_pos),
+            "Index": index,
+            **self.axis_values,
+            "Settle Mode": self.settle.mode,
+            "Settle Time": settle_time,
+            "Timestamp": datetime.datetime.now().isoformat(),
+        }
+        if extra:
+            metadata.update(extra)
+        for name, frame in self.camera_frames.items():
+            if name in self.camera_writers:
+                self.camera_writers[name].submit(frame, index, dict(
+                    metadata, **{"Camera": name, "Exposure": float(self.cameras[name].exposure)}))
+
+        metadata["Exposure"] = float(self.get_exposure())
+        if index in self.metrics:
+            metadata["Refinement Metric"] = self.metrics[index]
+        if self.hdr:
+            # The bracket exposures are in the scan parameters
+            metadata["HDR Saturated Pixels"] = self.hdr.saturated_pixels
+        elif self.frames_per_point > 1:
+            metadata["Frames Per Point"] = self.frames_per_point
+            metadata["Accumulation"] = self.accumulation
+        self.writer.submit(image_data, index, metadata)
+        return True
+
+    def _save_subframe(self, image_data, index, subframe, x_pos, y_pos):
+        """Queue one exposure of an accumulated point, or one HDR bracket, for saving"""
+        if not self.auto_save or self.subframe_writer is None:
+            return False
+        metadata = {
+            "X Position": float(x_pos),
+            "Y Position": float(y_pos),
+            "Index": index * self.subframes_per_point() + subframe,
+            "Point Index": index,
+            "Subframe": subframe,
+            "Exposure": float(self.camera.exposure),
+            "Timestamp": datetime.datetime.now().isoformat(),
+        }
+        self.subframe_writer.submit(image_data, metadata["Index"], metadata)
+        return True
 
 
 class Scanner_Backend:
-    def __init__(self, sn_x=None, sn_y=None, sn_cam=None):
+    def __init__(self, sn_x=None, sn_y=None, sn_cam=None, simulate=False, sim_stage_options=None, sim_camera_options=None):
+        """Create the backend, with timing-realistic simulated devices if simulate is True
+
+        sim_stage_options and sim_camera_options are passed to SimStage and SimCamera
+        to set motion profiles, sensor size, dtype, readout time and noise.
+        """
         self.x_stage = None
         self.y_stage = None
-        self.camera = Camera(sn_cam)
-        self.scan = Scan(self.camera, self.x_stage, self.y_stage)
+        self.simulate = simulate
+        self.cameras = {}  # Additional named cameras, e.g. a near-field camera beside the main far-field one
+        if simulate:
+            self.x_stage = SimStage("X", **(sim_stage_options or {}))
+            self.y_stage = SimStage("Y", **(sim_stage_options or {}))
+            self.camera = SimCamera(**(sim_camera_options or {}))
+        else:
+            self.camera = Camera(sn_cam)
+        self.scan = Scan(self.camera, self.x_stage, self.y_stage, self.cameras)
 
     def connect_cam(self, sn):
         self.camera = Camera(sn)
         self.scan.camera = self.camera
+
+    def add_camera(self, name, sn=None, camera=None, sim_camera_options=None):
+        """Add a named camera triggered together with the main camera at every scan point
+
+        Args:
+            name: name of the camera, its frames are saved to <prefix><name>_ outputs
+            sn: serial number of the camera
+            camera: an already created camera object, used instead of sn
+            sim_camera_options: SimCamera options when the backend is simulated
+        """
+        if name in self.cameras:
+            self.remove_camera(name)
+        if camera is None:
+            camera = SimCamera(**(sim_camera_options or {})) if self.simulate else Camera(sn)
+        self.cameras[name] = camera
+        print(f"Camera '{name}' added, {len(self.cameras) + 1} cameras per point")
+        return camera
+
+    def remove_camera(self, name):
+        camera = self.cameras.pop(name, None)
+        if camera:
+            camera.close()
         
     def connect_stage(self, sn, ax):
         if ax == 'x':
@@ -210,13 +1181,15 @@ class Scanner_Backend:
             self.y_stage = Stage("Y", sn)
             self.scan.y_stage = self.y_stage
 
-    def setup_scan_saving(self, folder, prefix, auto_save=True, overwrite=False):
+    def setup_scan_saving(self, folder, prefix, auto_save=True, overwrite=False, output_format="png", compression=None,
+                          compression_level=None):
         """Configure image saving parameters for the scan"""
-        return self.scan.setup_saving(folder, prefix, auto_save, overwrite)
+        return self.scan.setup_saving(folder, prefix, auto_save, overwrite, output_format, compression,
+                                      compression_level)
 
     def close(self):
         """Properly close the connection to the hardware"""
-        for device in [self.x_stage, self.y_stage, self.camera]:
+        for device in [self.x_stage, self.y_stage, self.camera, *self.cameras.values()]:
             if device: device.close()
     
     def __del__(self):
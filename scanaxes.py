@@ -0,0 +1,120 @@
+# scanaxes.py
+# extra scan dimensions (z, rotation, energy, exposure...) iterated around the x/y pattern of a Scan
+import numpy as np
+
+
+class CameraParameter:
+    """Drives a camera setting like a stage so it can be scanned as an axis
+
+    Uses the camera's set_<parameter> method, e.g. set_exposure for "exposure".
+    """
+    def __init__(self, camera, parameter='exposure'):
+        self.camera = camera
+        self.parameter = parameter
+        self.name = f"camera {parameter}"
+        self._setter = getattr(camera, f"set_{parameter}")
+        self.last_move_latency = None
+
+    @property
+    def position(self):
+        return getattr(self.camera, self.parameter)
+
+    def start_move_to(self, target_position):
+        self._setter(target_position)
+        return True
+
+    def wait_for_move(self):
+        return self.position
+
+    def move_to(self, target_position):
+        self.start_move_to(target_position)
+        return self.wait_for_move()
+
+
+class ScanAxis:
+    """One scanned quantity bound to a device
+
+    Args:
+        name: axis name, used as the metadata key of its value at each point
+        device: anything with start_move_to/wait_for_move and a position attribute
+            (Stage, XiStage, SimStage, CameraParameter)
+        positions: values visited, in order
+        relative: positions are offsets from the device position when the scan starts
+    """
+    def __init__(self, name, device, positions, relative=False):
+        self.name = name
+        self.device = device
+        self.positions = np.asarray(positions, dtype=float).reshape(-1)
+        self.relative = relative
+        self.origin = 0.0  # added to the positions, set at scan start for relative axes
+        if self.positions.size == 0:
+            raise ValueError(f"Axis '{name}' has no positions")
+
+    def describe(self):
+        return {'name': self.name, 'positions': self.positions.tolist(), 'relative': self.relative,
+                'origin': self.origin}
+
+
+class ScanPlan:
+    """Ordered set of axes, the first outermost
+
+    Each axis added is nested inside the previous ones, unless it is zipped
+    with an existing axis: zipped axes step together through positions of
+    equal length (e.g. energy with the matching exposure). With snake set,
+    inner levels reverse direction on alternate passes of the enclosing
+    levels so consecutive points differ by one step.
+    """
+    def __init__(self, snake=False):
+        self.snake = snake
+        self.axes = []
+        self.levels = []  # lists of zipped axes, outermost first
+
+    def add_axis(self, axis, zip_with=None):
+        """Add a ScanAxis nested inside the previous ones, or zipped with the axis named zip_with"""
+        if any(a.name == axis.name for a in self.axes):
+            raise ValueError(f"Axis '{axis.name}' is already in the plan")
+        if zip_with is None:
+            self.levels.append([axis])
+        else:
+            level = next((level for level in self.levels if any(a.name == zip_with for a in level)), None)
+            if level is None:
+                raise ValueError(f"No axis '{zip_with}' to zip '{axis.name}' with")
+            if axis.positions.size != level[0].positions.size:
+                raise ValueError(f"Axis '{axis.name}' has {axis.positions.size} positions, "
+                                 f"'{zip_with}' has {level[0].positions.size}")
+            level.append(axis)
+        self.axes.append(axis)
+        return axis
+
+    @property
+    def names(self):
+        return [axis.name for axis in self.axes]
+
+    def __len__(self):
+        return int(np.prod([level[0].positions.size for level in self.levels])) if self.levels else 1
+
+    def indices(self):
+        """(N, levels) array of the position index of each level at every point, in scan order"""
+        sizes = [level[0].positions.size for level in self.levels]
+        grid = np.indices(sizes).reshape(len(sizes), -1).T
+        if self.snake:
+            order = grid.copy()
+            for j in range(1, len(sizes)):
+                # Reverse the level on odd passes of everything enclosing it
+                passes = np.ravel_multi_index(order[:, :j].T, sizes[:j])
+                odd = passes % 2 == 1
+                grid[odd, j] = sizes[j] - 1 - grid[odd, j]
+        return grid
+
+    def points(self):
+        """(N, axes) array of device targets at every point, columns in the order the axes were added"""
+        grid = self.indices()
+        columns = {}
+        for j, level in enumerate(self.levels):
+            for axis in level:
+                columns[axis.name] = axis.positions[grid[:, j]] + axis.origin
+        return np.stack([columns[name] for name in self.names], axis=1).reshape(len(self), len(self.axes))
+
+    def describe(self):
+        return {'snake': self.snake, 'axes': [axis.describe() for axis in self.axes],
+                'levels': [[axis.name for axis in level] for level in self.levels]}
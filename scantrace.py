@@ -0,0 +1,88 @@
+# scantrace.py
+# structured per-point event trace of a scan: ring buffer, optional JSON-lines file and subscribers
+import collections
+import json
+import threading
+import time
+
+
+class ScanTrace:
+    """Timestamped events of each scan point
+
+    Every event is a dict {'event', 'index', 't', ...} with t from
+    time.monotonic(), so intervals between events are exact even if the
+    wall clock changes during a scan. The last `capacity` events stay in
+    memory; open() also appends them to a JSON-lines file, and subscribers
+    are called with each event from the thread that recorded it (the scan
+    loop or a writer thread), so they should return quickly.
+    """
+    EVENTS = ('command', 'motion_done', 'exposure_start', 'exposure_end', 'frame_received', 'frame_persisted')
+
+    def __init__(self, capacity=10000):
+        self.events = collections.deque(maxlen=capacity)
+        self.path = None
+        self._file = None
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback):
+        """Call callback(event) for every event recorded from now on"""
+        with self._lock:
+            self._subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def open(self, path, append=False):
+        """Also write events to a JSON-lines file"""
+        self.close()
+        try:
+            self._file = open(path, 'a' if append else 'w')
+            self.path = path
+        except IOError as e:
+            print(f"Error opening trace file '{path}': {e}")
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    def clear(self):
+        with self._lock:
+            self.events.clear()
+
+    def record(self, event, index, t=None, **fields):
+        """Record an event for point index, at monotonic time t (now if None)"""
+        entry = {'event': event, 'index': index, 't': time.monotonic() if t is None else t}
+        entry.update(fields)
+        with self._lock:
+            self.events.append(entry)
+            subscribers = list(self._subscribers)
+            if self._file:
+                try:
+                    self._file.write(json.dumps(entry) + "\n")
+                except (IOError, TypeError) as e:
+                    print(f"Error writing trace event: {e}")
+        for callback in subscribers:
+            try:
+                callback(entry)
+            except Exception as e:
+                print(f"Error in trace subscriber: {e}")
+        return entry
+
+    def point(self, index):
+        """Events of one point still in the buffer, as {event: t}"""
+        with self._lock:
+            return {e['event']: e['t'] for e in self.events if e['index'] == index}
+
+    def intervals(self, start='command', end='frame_persisted'):
+        """Time from start to end event for each point still in the buffer, as {index: seconds}"""
+        with self._lock:
+            events = list(self.events)
+        starts = {e['index']: e['t'] for e in events if e['event'] == start}
+        return {e['index']: e['t'] - starts[e['index']] for e in events
+                if e['event'] == end and e['index'] in starts}
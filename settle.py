@@ -0,0 +1,66 @@
+# settle.py
+# how long to wait after a move before the camera is triggered
+import time
+
+
+class SettlePolicy:
+    """Settle model applied after each scan move
+
+    Modes:
+        zero: trigger as soon as the stages report the move as finished
+        fixed: wait settle_time seconds
+        proportional: wait settle_time + settle_per_unit * step length
+        tolerance: poll the stage positions until all are within tolerance
+            of their targets, giving up after timeout seconds
+    """
+    MODES = ('zero', 'fixed', 'proportional', 'tolerance')
+
+    def __init__(self, mode='zero', settle_time=0.0, settle_per_unit=0.0,
+                 tolerance=0.001, timeout=2.0, poll_interval=0.01):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown settle mode '{mode}', expected one of {self.MODES}")
+        self.mode = mode
+        self.settle_time = settle_time  # seconds
+        self.settle_per_unit = settle_per_unit  # seconds per stage unit moved
+        self.tolerance = tolerance  # stage units
+        self.timeout = timeout  # seconds
+        self.poll_interval = poll_interval  # seconds
+
+    def wait(self, moves, step_length):
+        """Settle after a move
+
+        Args:
+            moves: list of (stage, target_position) pairs that were just moved
+            step_length: distance of the move in stage units
+
+        Returns:
+            settled: time spent settling in seconds
+        """
+        start = time.monotonic()
+        if self.mode == 'fixed':
+            time.sleep(self.settle_time)
+        elif self.mode == 'proportional':
+            time.sleep(self.settle_time + self.settle_per_unit * abs(step_length))
+        elif self.mode == 'tolerance':
+            self._wait_in_tolerance(moves, start)
+        return time.monotonic() - start
+
+    def _wait_in_tolerance(self, moves, start):
+        while True:
+            errors = [abs(stage.read_position() - target) for stage, target in moves if stage is not None]
+            if all(error <= self.tolerance for error in errors):
+                return
+            if time.monotonic() - start > self.timeout:
+                print(f"WARNING: stages did not settle within {self.tolerance} after {self.timeout}s, errors {errors}")
+                return
+            time.sleep(self.poll_interval)
+
+    def to_dict(self):
+        """Settle parameters for the scan metadata"""
+        return {
+            'mode': self.mode,
+            'settle_time': self.settle_time,
+            'settle_per_unit': self.settle_per_unit,
+            'tolerance': self.tolerance,
+            'timeout': self.timeout,
+        }
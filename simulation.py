@@ -0,0 +1,261 @@
+# simulation.py
+# timing-realistic stand-ins for Stage and Camera, for benchmarking the scan pipeline without hardware
+import time
+import numpy as np
+
+from motion import wait_for_motion
+from pathplanning import AxisProfile
+from devicestate import DeviceStateCache
+
+
+class SimStage:
+    """Simulated stage following a trapezoidal velocity profile
+
+    Moves take the time the real stage would: command latency plus the
+    acceleration, cruise and deceleration phases. read_position() follows
+    the trajectory, so tolerance settling and fly scans see a moving stage.
+    """
+    def __init__(self, name="unnamed", velocity=2.0, acceleration=10.0, command_latency=0.005,
+                 position_noise=0.0, units='mm'):
+        self.name = name
+        self.units = units
+        self.serial_number = None
+        self.translator = None
+        self.position = 0.0
+        self.zero_pos = 0.0
+        self.velocity = velocity  # units/s
+        self.acceleration = acceleration  # units/s^2
+        self.command_latency = command_latency  # s before the stage starts moving
+        self.position_noise = position_noise  # standard deviation of read_position in units
+        self.move_started = None
+        self.last_move_latency = None
+        self._rng = np.random.default_rng()
+        self._move_start = 0.0
+        self._move_from = 0.0
+        self._move_to = 0.0
+        self._move_end = 0.0
+        self.state = DeviceStateCache(self.name, self._read_state)
+        print(f"{self.name} stage initialized as a simulated stage ({velocity} {units}/s, {acceleration} {units}/s^2)")
+
+    def get_motion_profile(self):
+        """Velocity and acceleration used to estimate move times"""
+        return AxisProfile(self.velocity, self.acceleration, self.command_latency)
+
+    def set_velocity(self, velocity):
+        """Set the cruise velocity of the following moves"""
+        self.velocity = velocity
+
+    def set_zero(self):
+        self.zero_pos = self.position
+
+    def zero(self):
+        self.move_to(self.zero_pos)
+
+    def move_by(self, relative_distance):
+        """Move stage by a relative distance from current position"""
+        return self.move_to(self.position + relative_distance)
+
+    def move_to(self, target_position):
+        """Move stage to an absolute position"""
+        self.start_move_to(target_position)
+        return self.wait_for_move()
+
+    def start_move_to(self, target_position):
+        """Command an absolute move without waiting for it to finish"""
+        now = time.monotonic()
+        self.move_started = now
+        self._move_from = self._trajectory(now)
+        self._move_to = float(target_position)
+        self._move_start = now + self.command_latency
+        profile = AxisProfile(self.velocity, self.acceleration)
+        self._move_end = self._move_start + float(profile.move_time(self._move_to - self._move_from))
+        self.state.command(moving=True)
+        return True
+
+    def is_moving(self):
+        return time.monotonic() < self._move_end
+
+    def wait_for_move(self):
+        """Block until the last commanded move has finished and return the position"""
+        wait_for_motion(lambda: self.state.refresh().moving,
+                        wait=lambda: time.sleep(max(self._move_end - time.monotonic(), 0.0)))
+        self.position = self._move_to
+        # Cache a reading, with its encoder noise, rather than the nominal target
+        self.state.refresh()
+        if self.move_started is not None:
+            self.last_move_latency = time.monotonic() - self.move_started
+            self.move_started = None
+        print(f"Stage {self.name} moved to absolute position {self.position}")
+        return self.position
+
+    def read_position(self):
+        """Position along the current trajectory, with optional encoder noise"""
+        return self.state.refresh().position
+
+    def get_position(self, max_age=0.5):
+        """Position from the shared state cache, read again only if older than max_age seconds"""
+        return self.state.get(max_age).position
+
+    def _read_state(self):
+        now = time.monotonic()
+        position = self._trajectory(now)
+        if self.position_noise:
+            position += self._rng.normal(0.0, self.position_noise)
+        return {'position': position, 'moving': now < self._move_end}
+
+    def _trajectory(self, t):
+        """Noise-free position at monotonic time t"""
+        if t >= self._move_end:
+            return self._move_to
+        if t <= self._move_start:
+            return self._move_from
+        distance = self._move_to - self._move_from
+        direction = np.sign(distance)
+        total = abs(distance)
+        a = self.acceleration
+        # peak speed is lower than the velocity setting for short moves
+        v = min(self.velocity, np.sqrt(total * a))
+        t_ramp = v / a
+        elapsed = t - self._move_start
+        duration = self._move_end - self._move_start
+        if elapsed < t_ramp:
+            travelled = 0.5 * a * elapsed ** 2
+        elif elapsed < duration - t_ramp:
+            travelled = 0.5 * a * t_ramp ** 2 + v * (elapsed - t_ramp)
+        else:
+            remaining = duration - elapsed
+            travelled = total - 0.5 * a * remaining ** 2
+        return float(self._move_from + direction * min(travelled, total))
+
+    def close(self):
+        print(f"Closing simulated {self.name} stage")
+
+
+class SimCamera:
+    """Simulated camera with exposure, readout and arming costs and a noisy diffraction pattern
+
+    Frames are generated with numpy in the sensor's dtype: a far-field
+    pattern scaled by the exposure time, with Poisson shot noise and
+    Gaussian read noise, clipped to the bit depth.
+    """
+    def __init__(self, width=1440, height=1080, dtype='uint16', bit_depth=12, readout_time=0.03,
+                 arm_time=0.2, noise=True, read_noise=4.0, counts_per_ms=40.0):
+        self.serial_number = None
+        self.camera = None
+        self.exposure = 100  # Default exposure in ms
+        self.image_count = 0
+        self.armed = False
+        self.trigger_mode = "software"
+        self.buffer_frames = 16
+        self.trigger_timeout = 10.0
+        self.last_trigger_time = None
+
+        self.width = width
+        self.height = height
+        self.dtype = np.dtype(dtype)
+        self.bit_depth = bit_depth
+        self.readout_time = readout_time  # s to read a full frame off the sensor, scales with the rows read
+        self.arm_time = arm_time  # s to arm and disarm the sensor when snapping single frames
+        self.noise = noise
+        self.read_noise = read_noise  # counts rms
+        self.counts_per_ms = counts_per_ms  # peak counts per ms of exposure
+        self.roi = None
+        self.binning = (1, 1)
+        self._rng = np.random.default_rng()
+        self._pattern = self._make_pattern()
+        print(f"Camera initialized as a simulated {width}x{height} {self.dtype.name} sensor")
+
+    def _make_pattern(self):
+        """Normalised Airy-like far-field pattern centred on the sensor, cropped and binned to the ROI"""
+        y, x = np.ogrid[:self.height, :self.width]
+        r = np.hypot(x - self.width / 2, y - self.height / 2) / (0.02 * min(self.width, self.height))
+        pattern = (np.sinc(r) ** 2).astype(np.float32)
+        if self.roi is not None:
+            hstart, hend, vstart, vend = self.roi
+            hbin, vbin = self.binning
+            pattern = pattern[vstart:vend, hstart:hend]
+            # Binned pixels collect the charge of every pixel in the bin
+            h, w = pattern.shape
+            pattern = pattern.reshape(h // vbin, vbin, w // hbin, hbin).sum(axis=(1, 3))
+        return pattern
+
+    def set_roi(self, hstart=0, hend=None, vstart=0, vend=None, hbin=1, vbin=1):
+        """Crop and bin the simulated sensor, readout time shrinks with the rows read"""
+        was_armed = self.armed
+        self.disarm()
+        hend = self.width if hend is None else min(hend, self.width)
+        vend = self.height if vend is None else min(vend, self.height)
+        # Like the hardware, only whole bins are read out
+        hend -= (hend - hstart) % hbin
+        vend -= (vend - vstart) % vbin
+        self.roi = (hstart, hend, vstart, vend)
+        self.binning = (hbin, vbin)
+        self._pattern = self._make_pattern()
+        print(f"Camera ROI set to columns {hstart}-{hend}, rows {vstart}-{vend}, binning {hbin}x{vbin} (simulation)")
+        if was_armed:
+            self.arm()
+        return self.get_roi()
+
+    def clear_roi(self):
+        return self.set_roi()
+
+    def get_roi(self):
+        hstart, hend, vstart, vend = self.roi or (0, self.width, 0, self.height)
+        hbin, vbin = self.binning
+        return {'hstart': hstart, 'hend': hend, 'vstart': vstart, 'vend': vend, 'hbin': hbin, 'vbin': vbin}
+
+    def get_detector_size(self):
+        return self.width, self.height
+
+    def get_saturation_level(self):
+        return 2 ** self.bit_depth - 1
+
+    def get_readout_time(self):
+        """Readout time of the current ROI, proportional to the sensor rows read"""
+        roi = self.get_roi()
+        return self.readout_time * (roi['vend'] - roi['vstart']) / self.height
+
+    def set_exposure(self, exposure_ms):
+        """Set the camera exposure in milliseconds"""
+        self.exposure = exposure_ms
+        print(f"Camera exposure set to {exposure_ms}ms (simulation)")
+
+    def arm(self, trigger_mode=None, buffer_frames=None):
+        """Start a simulated armed acquisition, paying the arming cost once"""
+        if trigger_mode is not None:
+            self.trigger_mode = trigger_mode
+        if buffer_frames is not None:
+            self.buffer_frames = buffer_frames
+        if not self.armed:
+            time.sleep(self.arm_time / 2)
+            self.armed = True
+            print(f"Camera armed with {self.trigger_mode} trigger (simulation)")
+        return True
+
+    def disarm(self):
+        if self.armed:
+            time.sleep(self.arm_time / 2)
+            self.armed = False
+
+    def snap_image(self):
+        """Take an image with current settings and return image data"""
+        self.image_count += 1
+        if not self.armed:
+            time.sleep(self.arm_time)
+        self.last_trigger_time = time.monotonic()
+        time.sleep(self.exposure / 1000.0 + self.get_readout_time())
+        return self.generate_frame()
+
+    def generate_frame(self):
+        """Frame for the current exposure in the sensor dtype"""
+        expected = self._pattern * (self.counts_per_ms * self.exposure)
+        if self.noise:
+            frame = self._rng.poisson(expected).astype(np.float32)
+            frame += self._rng.normal(0.0, self.read_noise, frame.shape).astype(np.float32)
+        else:
+            frame = expected
+        return np.clip(frame, 0, 2 ** self.bit_depth - 1).astype(self.dtype)
+
+    def close(self):
+        self.disarm()
+        print("Closing simulated camera")
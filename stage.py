@@ -1,5 +1,8 @@
 # stage.py
 from pylablib.devices.Thorlabs import KinesisMotor  
+from motion import wait_for_motion, MOVE_TIMEOUT
+from pathplanning import AxisProfile
+from devicestate import DeviceStateCache
 import time
 
 class Stage:
@@ -9,6 +12,11 @@ class Stage:
         self.serial_number = serial_number
         self.translator = None
         self.zero_pos = 0.0 
+        self._sim_target = None
+        self._sim_move_end = 0.0
+        self.move_started = None
+        self.last_move_latency = None  # seconds from command to completion of the last move
+        self.state = DeviceStateCache(self.name, self._read_state)  # shared cache of position and motion
         if self.serial_number is None:
             print(f"WARNING: {self.name} stage initialized in simulation mode (no serial number provided)")
         else:
@@ -49,23 +57,89 @@ class Stage:
         
     def move_to(self, target_position):
         """Move stage to an absolute position"""
+        self.start_move_to(target_position)
+        return self.wait_for_move()
+
+    def start_move_to(self, target_position):
+        """Command an absolute move without waiting, returns False if the command failed"""
+        self.move_started = time.monotonic()
         if self.translator:
             try:
                 self.translator.move_to(target_position-self.zero_pos)
-                while self.translator.is_moving:
-                    time.sleep(0.5)
             except Exception as e:
                 print(f"Error during absolute movement: {e}")
-            self.position = self.translator.get_position()
+                return False
         else:
             # Simulation mode
-            time.sleep(0.5) # emulate hardware wait
-            self.position = target_position
-            
+            self._sim_target = target_position
+            self._sim_move_end = time.time() + 0.5 # emulate hardware wait
+        self.state.command(moving=True)
+        return True
+
+    def wait_for_move(self):
+        """Block until the last commanded move has finished and return the position"""
+        if self.translator:
+            try:
+                wait_for_motion(lambda: self.state.refresh().moving,
+                                wait=lambda: self.translator.wait_move(timeout=MOVE_TIMEOUT))
+            except Exception as e:
+                print(f"Error during absolute movement: {e}")
+            position = self.state.refresh().position
+            if position is not None:
+                self.position = position - self.zero_pos
+        else:
+            # Simulation mode
+            remaining = self._sim_move_end - time.time()
+            if remaining > 0:
+                time.sleep(remaining)
+            if self._sim_target is not None:
+                self.position = self._sim_target
+            self.state.update(position=self.position, moving=False)
 
-        print(f"Stage {self.name} moved to absolute position {self.position}")
+        if self.move_started is not None:
+            self.last_move_latency = time.monotonic() - self.move_started
+            self.move_started = None
+            print(f"Stage {self.name} moved to absolute position {self.position} in {self.last_move_latency*1000:.1f} ms")
+        else:
+            print(f"Stage {self.name} moved to absolute position {self.position}")
         return self.position
     
+    def read_position(self):
+        """Read the measured position in the same coordinates as move_to targets"""
+        position = self.state.refresh().position
+        return self.position if position is None else position
+
+    def get_position(self, max_age=0.5):
+        """Position from the shared state cache, read again only if older than max_age seconds"""
+        position = self.state.get(max_age).position
+        return self.position if position is None else position
+
+    def _read_state(self):
+        """The one place the controller is asked for its position and motion"""
+        if self.translator:
+            return {'position': self.translator.get_position() + self.zero_pos,
+                    'moving': self.translator.is_moving()}
+        return {'position': self.position, 'moving': time.time() < self._sim_move_end}
+
+    def set_velocity(self, velocity):
+        """Set the maximum velocity of the following moves"""
+        if self.translator:
+            try:
+                self.translator.setup_velocity(max_velocity=velocity)
+            except Exception as e:
+                print(f"Error setting {self.name} stage velocity: {e}")
+
+    def get_motion_profile(self):
+        """Velocity and acceleration used to estimate move times"""
+        if self.translator:
+            try:
+                params = self.translator.get_velocity_parameters()
+                return AxisProfile(params.max_velocity, params.acceleration)
+            except Exception as e:
+                print(f"Error reading {self.name} stage velocity parameters: {e}")
+        # Simulated moves take a flat 0.5 s whatever the distance
+        return AxisProfile(velocity=1e9, acceleration=1e18, overhead=0.5)
+
     def close(self):
         """Properly close the connection to the hardware"""
         if self.translator:
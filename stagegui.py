@@ -1,11 +1,12 @@
+import threading
 import tkinter as tk
 from tkinter import messagebox
 from stage import Stage
 from xStage import XiStage, default_params
-import tkinter as tk
-from tkinter import messagebox
 
 class StageGUI:
+    REFRESH_INTERVAL = 500  # ms between position label updates
+
     def __init__(self, master, stage):
         self.master = master
         self.stage = stage
@@ -42,6 +43,37 @@ class StageGUI:
         
         self.goto_zero_button = tk.Button(master, text="Go to Zero", command=self.goto_zero_stage)
         self.goto_zero_button.grid(row=4, column=1, padx=10, pady=10)
+
+        self._refresh_id = None
+        self._refreshing = False
+        if hasattr(self.stage, 'state'):
+            self.position_label.bind("<Destroy>", self.stop_refresh)
+            self.refresh_position()
+
+    def refresh_position(self):
+        """Show the cached stage position, reading the controller in the background when nobody else has lately"""
+        self._refresh_id = None
+        if not self.position_label.winfo_exists():
+            return
+        state = self.stage.state.get()
+        if state.position is not None:
+            moving = " (moving)" if state.moving else ""
+            self.position_label.config(text=f"Position: {state.position:.4f}{moving}")
+        if state.age > self.REFRESH_INTERVAL / 1000 and not self._refreshing:
+            self._refreshing = True
+            threading.Thread(target=self._read_state, daemon=True).start()
+        self._refresh_id = self.master.after(self.REFRESH_INTERVAL, self.refresh_position)
+
+    def _read_state(self):
+        try:
+            self.stage.state.refresh()
+        finally:
+            self._refreshing = False
+
+    def stop_refresh(self, event=None):
+        if self._refresh_id is not None:
+            self.master.after_cancel(self._refresh_id)
+            self._refresh_id = None
         
     def connect_stage(self):
         """Attempt to connect the stage using the serial number provided."""
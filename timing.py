@@ -0,0 +1,48 @@
+# timing.py
+# per-phase wall time collection for the scan loop and the writer threads
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+
+
+class PhaseTimer:
+    """Thread-safe collection of durations per named phase (move_x, exposure, encode...)"""
+    def __init__(self):
+        self.durations = {}
+        self._lock = threading.Lock()
+
+    def add(self, phase, seconds):
+        """Record one duration in seconds"""
+        with self._lock:
+            self.durations.setdefault(phase, []).append(seconds)
+
+    @contextmanager
+    def time(self, phase):
+        """Record the wall time of the enclosed block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, time.perf_counter() - start)
+
+    def reset(self):
+        with self._lock:
+            self.durations = {}
+
+    def summary(self):
+        """Distribution of each phase in seconds: count, total, mean, median, p95, min, max"""
+        with self._lock:
+            durations = {phase: np.array(values) for phase, values in self.durations.items()}
+        summary = {}
+        for phase, values in durations.items():
+            summary[phase] = {
+                'count': int(values.size),
+                'total': float(values.sum()),
+                'mean': float(values.mean()),
+                'median': float(np.median(values)),
+                'p95': float(np.percentile(values, 95)),
+                'min': float(values.min()),
+                'max': float(values.max()),
+            }
+        return summary
@@ -0,0 +1,198 @@
+# writer.py
+# background saving of scan frames so that encoding overlaps with the next move
+import os
+import datetime
+import json
+import re
+import queue
+import threading
+import time
+
+from framecodecs import FrameCodec
+
+
+class FileWriter:
+    """Saves each frame as an image file (PNG by default) with a .txt sidecar holding its metadata"""
+    # Files are independent so any number of workers can encode and write at once
+    max_workers = None
+
+    def __init__(self, folder, prefix, overwrite=False, codec=None, suffix=''):
+        self.save_folder = folder
+        self.image_prefix = prefix
+        self.suffix = suffix  # added after the index, keeps this scan's files apart from earlier ones
+        self.overwrite = overwrite
+        self.codec = codec or FrameCodec('png')
+        self.location = folder
+        self.frames = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+        self._stats_lock = threading.Lock()
+
+    def write(self, image_data, index, metadata, timings=None):
+        """Save the image with position metadata
+
+        Args:
+            image_data: numpy image data
+            index: Image sequence number
+            metadata: dict of values written line by line to the companion file
+            timings: optional PhaseTimer receiving the encode, write and metadata times
+
+        Returns:
+            filepath: Path to saved image or None if saving failed
+        """
+        try:
+            # Create filename with index
+            extension = self.codec.extension
+            filename = f"{self.image_prefix}{index:04d}{self.suffix}{extension}"
+            filepath = os.path.join(self.save_folder, filename)
+
+            # Check if file exists and handle accordingly
+            if os.path.exists(filepath) and not self.overwrite:
+                timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+                filename = f"{self.image_prefix}{index:04d}{self.suffix}_{timestamp}{extension}"
+                filepath = os.path.join(self.save_folder, filename)
+                print(f"File already exists. Saving as {filename} instead")
+
+            # Encode in this worker thread, the codecs release the GIL while compressing
+            start = time.perf_counter()
+            try:
+                encoded = self.codec.encode(image_data)
+            except Exception as e:
+                print(f"Failed to encode image for {filepath}: {e}")
+                return None
+            encoded_at = time.perf_counter()
+
+            with open(filepath, 'wb') as f:
+                f.write(encoded)
+            written_at = time.perf_counter()
+            with self._stats_lock:
+                self.frames += 1
+                self.raw_bytes += image_data.nbytes
+                self.stored_bytes += len(encoded)
+
+            print(f"Saved image to {filepath}")
+
+            # Add position metadata to a companion file
+            metadata_path = filepath[:-len(extension)] + '.txt'
+            with open(metadata_path, 'w') as f:
+                for key, value in metadata.items():
+                    f.write(f"{key}: {value}\n")
+
+            if timings is not None:
+                timings.add('encode', encoded_at - start)
+                timings.add('write', written_at - encoded_at)
+                timings.add('metadata', time.perf_counter() - written_at)
+            return filepath
+
+        except Exception as e:
+            print(f"Error saving image: {e}")
+            return None
+
+    def write_parameters(self, parameters):
+        """Save the scan parameters as JSON next to the images"""
+        filepath = os.path.join(self.save_folder, f"{self.image_prefix}parameters{self.suffix}.json")
+        try:
+            with open(filepath, 'w') as f:
+                json.dump(parameters, f, indent=4)
+        except (IOError, TypeError) as e:
+            print(f"Error saving scan parameters: {e}")
+
+    def written_indices(self):
+        """Indices of the frames this scan saved in the folder with their metadata
+
+        Only names with this writer's suffix count, frames of other scans
+        sharing the folder and prefix are ignored.
+        """
+        extension = self.codec.extension
+        pattern = re.compile(re.escape(self.image_prefix) + r'(\d{4,})' + re.escape(self.suffix + extension) + '$')
+        indices = set()
+        for name in os.listdir(self.save_folder):
+            match = pattern.match(name)
+            if match and os.path.exists(os.path.join(self.save_folder, name[:-len(extension)] + '.txt')):
+                indices.add(int(match.group(1)))
+        return indices
+
+    def compression_stats(self):
+        """Frames, raw and stored bytes and compression ratio of the frames written so far"""
+        with self._stats_lock:
+            return compression_stats(self.codec.describe(), self.frames, self.raw_bytes, self.stored_bytes)
+
+    def close(self):
+        """Nothing is held open between frames"""
+        pass
+
+
+def compression_stats(codec, frames, raw_bytes, stored_bytes):
+    """Summary reported by every writer at the end of a scan"""
+    return {
+        'codec': codec,
+        'frames': frames,
+        'raw_bytes': raw_bytes,
+        'stored_bytes': stored_bytes,
+        'ratio': raw_bytes / stored_bytes if stored_bytes else None,
+    }
+
+
+class WriterPipeline:
+    """Bounded queue of frames drained by worker threads into a writer
+
+    submit() only blocks when the queue is full, so the scan loop can start
+    the next move as soon as the exposure has finished. close() waits until
+    every queued frame has been written.
+    """
+    _STOP = object()
+
+    def __init__(self, writer, num_workers=2, max_queued=8, on_written=None, timings=None):
+        self.writer = writer
+        self.on_written = on_written  # called with the index of each frame once it is saved
+        self.timings = timings  # optional PhaseTimer passed on to the writer
+        if writer.max_workers is not None:
+            num_workers = min(num_workers, writer.max_workers)
+        self.num_workers = max(1, num_workers)
+        self.queue = queue.Queue(maxsize=max_queued)
+        self.workers = []
+        self.error_count = 0
+        self._error_lock = threading.Lock()
+
+    def start(self):
+        """Start the worker threads"""
+        for n in range(self.num_workers):
+            worker = threading.Thread(target=self._run, name=f"writer-{n}")
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    def submit(self, image_data, index, metadata):
+        """Queue a frame for saving, waits for a free slot if the queue is full"""
+        self.queue.put((image_data, index, metadata))
+
+    def close(self):
+        """Drain the queue, stop the workers and close the writer"""
+        for _ in self.workers:
+            self.queue.put(self._STOP)
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+        self.writer.close()
+        if self.error_count:
+            print(f"WARNING: {self.error_count} frames failed to save")
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is self._STOP:
+                    return
+                if self.writer.write(*item, timings=self.timings) is None:
+                    self._record_error()
+                elif self.on_written:
+                    self.on_written(item[1])
+            except Exception as e:
+                print(f"Error in writer thread: {e}")
+                self._record_error()
+            finally:
+                self.queue.task_done()
+
+    def _record_error(self):
+        with self._error_lock:
+            self.error_count += 1
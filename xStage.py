@@ -4,6 +4,9 @@ import libximc.highlevel as ximc
 from axis import Axis
 from axisparameters import * # AxisParameters
 from customconfigparser import ConfigParser
+from motion import wait_for_motion
+from pathplanning import AxisProfile
+from devicestate import DeviceStateCache
 import time
 
 default_params = AxisParameters(
@@ -50,6 +53,10 @@ class XiStage:
         self.axis = Axis(xi_params,self.config_parser)
         self.min_value = xi_params.min_value 
         self.max_value = xi_params.max_value 
+        self._limits_version = None
+        self.move_started = None
+        self.last_move_latency = None  # seconds from command to completion of the last move
+        self.state = DeviceStateCache(self.name, self._read_state)  # shared with the GUI and AxisMonitor
         self._connect_stage()
         
         print("get_pos")
@@ -75,21 +82,88 @@ class XiStage:
         return self.move_to(target)
         
     def move_to(self, target_position):
-        if (target_position < self.config_parser.get_entry('min_value') 
-            or target_position > self.config_parser.get_entry('max_value')):
-            print(f"ERROR target position is outside software limits!")
+        if not self.start_move_to(target_position):
             return self.position
+        return self.wait_for_move()
+
+    def start_move_to(self, target_position):
+        """Command an absolute move without waiting, returns False if the target is out of limits"""
+        min_value, max_value = self.get_limits()
+        if target_position < min_value or target_position > max_value:
+            print(f"ERROR target position is outside software limits!")
+            return False
 
+        self.move_started = time.monotonic()
         self.axis.move(target_position)
-        while self.axis.get_status.is_moving():
-            time.sleep(0.5)
+        self.state.command(moving=True)
+        return True
 
-        self.position = self.axis.get_position()
+    def wait_for_move(self):
+        """Block until the last commanded move has finished and return the position"""
+        wait_for_motion(lambda: self.state.refresh().moving, wait=self._wait_for_stop)
 
-            
-        print(f"Stage {self.name} moved to absolute position {self.position}")
+        self.position = self.read_position()
+
+        if self.move_started is not None:
+            self.last_move_latency = time.monotonic() - self.move_started
+            self.move_started = None
+            print(f"Stage {self.name} moved to absolute position {self.position} in {self.last_move_latency*1000:.1f} ms")
+        else:
+            print(f"Stage {self.name} moved to absolute position {self.position}")
         return self.position
+
+    def _wait_for_stop(self):
+        """libximc blocking wait, raises so the caller can fall back to polling"""
+        self.axis.wait_for_stop()
+        if self.axis.has_error():
+            raise RuntimeError(self.axis.error)
     
+    def read_position(self):
+        """Read the measured position in the same coordinates as move_to targets"""
+        position = self.state.refresh().position
+        return self.position if position is None else position
+
+    def get_position(self, max_age=0.5):
+        """Position from the shared state cache, read again only if older than max_age seconds"""
+        position = self.state.get(max_age).position
+        return self.position if position is None else position
+
+    def get_limits(self):
+        """Software limits, looked up in the config again only when it has changed"""
+        # A lookup in the cached config, which also notices a changed file and bumps the version
+        min_value = self.config_parser.get_entry('min_value')
+        if self._limits_version != self.config_parser.version:
+            max_value = self.config_parser.get_entry('max_value')
+            self.min_value = self.min_value if min_value is None else min_value
+            self.max_value = self.max_value if max_value is None else max_value
+            self._limits_version = self.config_parser.version
+        return self.min_value, self.max_value
+
+    def monitor(self, parent=None):
+        """AxisMonitor polling this stage through its state cache instead of its own status reads"""
+        from axismonitor import AxisMonitor  # needs PySide6, only imported when a monitor is wanted
+        return AxisMonitor(self.axis, parent, state=self.state)
+
+    def _read_state(self):
+        """One calibrated status read gives position, motion and the AxisStatus"""
+        status = self.axis.get_status()
+        if status.status is None:
+            # Motion is unknown, stop wait_for_move from polling until its timeout
+            return {'moving': False, 'status': status, 'error': str(self.axis.error)}
+        return {'position': status.position, 'moving': status.is_moving, 'status': status}
+
+    def set_velocity(self, velocity):
+        """Set the maximum velocity of the following moves"""
+        self.axis.set_speed(velocity)
+
+    def get_motion_profile(self):
+        """Velocity and acceleration used to estimate move times"""
+        settings = self.axis.get_move_settings()
+        if settings is None:
+            print(f"Error reading {self.name} move settings: {self.axis.error}")
+            return AxisProfile()
+        return AxisProfile(settings.Speed, settings.Accel)
+
     def close(self):
         """Properly close the connection to the hardware"""
         try:
@@ -99,6 +173,7 @@ class XiStage:
             print(f"Error closing {self.name} stage: {e}")
         finally:
             self.axis = None
+            self.config_parser.flush()
 
     def __del__(self):
         """Destructor to ensure stage is closed when object is deleted"""